@@ -1,8 +1,21 @@
 from aiohttp import web
 from app.views import (
     create_ad, get_ad, update_ad, delete_ad, get_ads,
-    register, login
+    create_ads_batch, delete_ads_batch, export_ads, search_ads, get_user_ads, stream_ads,
+    get_changes, upload_ad_images, get_image,
+    register, login, metrics, get_profiling, update_profiling
 )
+from app.admission import setup_admission
+from app.auth import close_password_pool
+from app.broadcast import setup_broadcast
+from app.changes import start_tombstone_purge, stop_tombstone_purge
+from app.compression import setup_compression
+from app.images import IMAGE_NAME_PATTERN
+from app.lifecycle import setup_inflight
+from app.metrics import setup_metrics
+from app.profiling import setup_profiling
+from app.response_cache import setup_response_cache
+from app.writer import start_writer, stop_writer
 
 
 def setup_routes(app):
@@ -13,12 +26,44 @@ def setup_routes(app):
     # Объявления
     app.router.add_post('/ads', create_ad)
     app.router.add_get('/ads', get_ads)
+    app.router.add_post('/ads/batch', create_ads_batch)
+    app.router.add_delete('/ads/batch', delete_ads_batch)
+    app.router.add_get('/ads/export', export_ads)
+    app.router.add_get('/ads/search', search_ads)
+    app.router.add_get('/ads/stream', stream_ads)
+    app.router.add_get('/ads/changes', get_changes)
     app.router.add_get(r'/ads/{ad_id:\d+}', get_ad)
     app.router.add_put(r'/ads/{ad_id:\d+}', update_ad)
     app.router.add_delete(r'/ads/{ad_id:\d+}', delete_ad)
+    
+    # Изображения объявлений
+    app.router.add_post(r'/ads/{ad_id:\d+}/images', upload_ad_images)
+    app.router.add_get('/images/{name:%s}' % IMAGE_NAME_PATTERN, get_image)
+    
+    # Пользователи
+    app.router.add_get(r'/users/{user_id:\d+}/ads', get_user_ads)
+    
+    # Мониторинг
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/admin/profiling', get_profiling)
+    app.router.add_put('/admin/profiling', update_profiling)
 
 
 async def init_app():
     app = web.Application()
     setup_routes(app)
+    setup_inflight(app)
+    setup_broadcast(app)
+    setup_metrics(app)
+    setup_profiling(app)
+    # Сжатие снаружи кеша: кеш хранит исходное тело и сжатые варианты
+    setup_compression(app)
+    setup_response_cache(app)
+    # Лимиты внутри кеша: попадания в кеш не занимают слотов
+    setup_admission(app)
+    app.on_startup.append(start_writer)
+    app.on_startup.append(start_tombstone_purge)
+    app.on_cleanup.append(stop_tombstone_purge)
+    app.on_cleanup.append(stop_writer)
+    app.on_cleanup.append(close_password_pool)
     return app
@@ -0,0 +1,193 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+from aiohttp import web
+
+from app.cache import LRUCache
+
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Одновременно обрабатываемые запросы по классам маршрутов. Запись всё равно
+# идёт через одного писателя SQLite, вход упирается в пул bcrypt.
+ADMISSION_READ_LIMIT = int(os.getenv("ADMISSION_READ_LIMIT", "64"))
+ADMISSION_WRITE_LIMIT = int(os.getenv("ADMISSION_WRITE_LIMIT", "32"))
+ADMISSION_AUTH_LIMIT = int(os.getenv("ADMISSION_AUTH_LIMIT", "16"))
+# Длина очереди ожидания (в долях лимита) и срок ожидания в ней, с
+ADMISSION_QUEUE_FACTOR = float(os.getenv("ADMISSION_QUEUE_FACTOR", "4"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+ADMISSION_RETRY_AFTER = 1
+
+# Ограничение частоты запросов к маршрутам с require_auth (0 — выключено)
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_KEY = os.getenv("RATE_LIMIT_KEY", "user")  # user | ip
+RATE_LIMIT_MAX_KEYS = 100000
+
+# Служебные маршруты не ограничиваются: мониторинг нужен именно под нагрузкой.
+# Живая лента держит соединение часами, у неё свой лимит подписчиков.
+EXEMPT_PREFIXES = ("/metrics", "/admin/", "/ads/stream")
+
+
+class AdmissionGate:
+    """Ограничение параллельности с ограниченной очередью FIFO и сроком ожидания.
+
+    Запрос, не получивший слот за timeout секунд или заставший полную
+    очередь, отклоняется сразу — быстрый 503 дешевле, чем таймаут клиента
+    после долгого ожидания блокировки SQLite или bcrypt.
+    """
+
+    def __init__(self, limit: int, max_queue: int, timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.admitted = 0
+        self.shed = 0
+        self._waiters = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Занять слот; False — запрос нужно отклонить"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done() or waiter.cancelled():
+                self.shed += 1
+                return False
+        except asyncio.CancelledError:
+            # Клиент ушёл, но слот мог быть уже передан этому запросу
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+        return True
+
+    def release(self):
+        # Слот передаётся первому ожидающему без уменьшения active
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+def route_class(request):
+    """Класс маршрута для лимитов: auth, read или write (None — без ограничений)"""
+    path = request.path
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path.startswith("/auth/"):
+        return "auth"
+    if request.method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class TokenBucketLimiter:
+    """Token bucket по ключу (пользователь или IP): rate токенов/с, запас burst"""
+
+    def __init__(self, rate: float = RATE_LIMIT_RPS, burst: int = RATE_LIMIT_BURST,
+                 max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.limited = 0
+        self._buckets = LRUCache(maxsize=max_keys)
+
+    def retry_after(self, key) -> float:
+        """0 — запрос разрешён (токен списан), иначе секунды до следующего токена"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = float(self.burst)
+        else:
+            tokens, updated = bucket
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self._buckets.set(key, (tokens - 1, now))
+            return 0.0
+        self._buckets.set(key, (tokens, now))
+        self.limited += 1
+        return (1 - tokens) / self.rate
+
+
+rate_limiter = TokenBucketLimiter() if RATE_LIMIT_RPS > 0 else None
+
+
+def check_rate_limit(request, user):
+    """429 с Retry-After, если пользователь (или IP) исчерпал свой token bucket"""
+    if rate_limiter is None:
+        return
+    key = request.remote if RATE_LIMIT_KEY == "ip" else user.id
+    wait = rate_limiter.retry_after(key)
+    if wait:
+        raise web.HTTPTooManyRequests(
+            reason="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))}
+        )
+
+
+@web.middleware
+async def admission_middleware(request, handler):
+    gate = request.app["admission"].get(route_class(request))
+    if gate is None:
+        return await handler(request)
+    if not await gate.acquire():
+        return web.json_response(
+            {"error": "Server is overloaded, retry later"}, status=503,
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+        )
+    try:
+        return await handler(request)
+    finally:
+        gate.release()
+
+
+def admission_metrics(app):
+    """Глубина очередей, занятые слоты и отказы по классам маршрутов"""
+    gates = app.get("admission", {})
+    extra = [
+        ("app_admission_active", "gauge", "Requests holding an admission slot",
+         {(("class", name),): gate.active for name, gate in gates.items()}),
+        ("app_admission_queue_depth", "gauge", "Requests waiting for an admission slot",
+         {(("class", name),): gate.queued for name, gate in gates.items()}),
+        ("app_admission_shed_total", "counter", "Requests rejected with 503",
+         {(("class", name),): gate.shed for name, gate in gates.items()}),
+    ]
+    if rate_limiter is not None:
+        extra.append(("app_rate_limited_total", "counter", "Requests rejected with 429",
+                      rate_limiter.limited))
+    return extra
+
+
+def _gate(limit: int) -> AdmissionGate:
+    return AdmissionGate(limit, max_queue=int(limit * ADMISSION_QUEUE_FACTOR))
+
+
+def setup_admission(app):
+    app["admission"] = {}
+    if ADMISSION_ENABLED:
+        app["admission"] = {
+            "read": _gate(ADMISSION_READ_LIMIT),
+            "write": _gate(ADMISSION_WRITE_LIMIT),
+            "auth": _gate(ADMISSION_AUTH_LIMIT),
+        }
+        app.middlewares.append(admission_middleware)
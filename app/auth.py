@@ -1,23 +1,56 @@
 import jwt
 import bcrypt
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta
 from aiohttp import web
 from functools import wraps
 from app.models import User
-from app.database import async_session
+from app.database import read_session
+from app.writer import run_write
+from app.cache import LRUCache
+from app.admission import check_rate_limit
+from sqlalchemy import event, inspect
 from sqlalchemy.future import select
 from app.schemas import UserCreateSchema, LoginSchema
 
 
+logger = logging.getLogger(__name__)
+
 # Секретный ключ для JWT (в продакшене должен быть в переменных окружения)
 SECRET_KEY = "your-secret-key-here"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Хеширование паролей выполняется вне event loop в ограниченном пуле
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_POOL = os.getenv("PASSWORD_POOL", "thread")  # thread | process
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "4"))
+PASSWORD_CONCURRENCY = int(os.getenv("PASSWORD_CONCURRENCY", str(PASSWORD_WORKERS * 2)))
+PASSWORD_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_QUEUE_TIMEOUT", "5"))
+PASSWORD_RETRY_AFTER = 1
+
+_password_executor = None
+_password_slots = None
+
+# Кеши для require_auth: токен -> username (до exp токена) и username -> User
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+_token_cache = LRUCache(maxsize=PRINCIPAL_CACHE_SIZE)
+_principal_cache = LRUCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+# Пользователи с доступом к служебным маршрутам (/admin/...), через запятую
+ADMIN_USERNAMES = frozenset(
+    name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()
+)
+
 
 def hash_password(password: str) -> str:
     """Хеширование пароля"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 
@@ -26,6 +59,68 @@ def verify_password(password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Хеш создан с другой стоимостью bcrypt, чем задана сейчас"""
+    try:
+        return int(hashed_password.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def _get_password_executor():
+    global _password_executor
+    if _password_executor is None:
+        if PASSWORD_POOL == "process":
+            _password_executor = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS)
+        else:
+            _password_executor = ThreadPoolExecutor(
+                max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt"
+            )
+    return _password_executor
+
+
+async def _run_password_job(func, *args):
+    """Запуск bcrypt в пуле с ограничением очереди.
+
+    Если слот не освободился за PASSWORD_QUEUE_TIMEOUT секунд, запрос
+    отклоняется с 503, а не копится в очереди.
+    """
+    global _password_slots
+    if _password_slots is None:
+        _password_slots = asyncio.Semaphore(PASSWORD_CONCURRENCY)
+    try:
+        await asyncio.wait_for(_password_slots.acquire(), PASSWORD_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise web.HTTPServiceUnavailable(
+            reason="Password service is busy",
+            headers={"Retry-After": str(PASSWORD_RETRY_AFTER)}
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_password_executor(), func, *args)
+    finally:
+        _password_slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    """Хеширование пароля в пуле"""
+    return await _run_password_job(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    """Проверка пароля в пуле"""
+    return await _run_password_job(verify_password, password, hashed_password)
+
+
+async def close_password_pool(app):
+    """Остановка пула хеширования при завершении приложения"""
+    global _password_executor, _password_slots
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False)
+        _password_executor = None
+    _password_slots = None
+
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Создание JWT токена"""
     to_encode = data.copy()
@@ -38,8 +133,11 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str) -> User:
-    """Получение текущего пользователя по токену"""
+def decode_token(token: str) -> str:
+    """Проверка токена и получение username; результат кешируется до exp"""
+    username = _token_cache.get(token)
+    if username is not None:
+        return username
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -47,15 +145,48 @@ async def get_current_user(token: str) -> User:
             raise web.HTTPUnauthorized(reason="Invalid token")
     except jwt.PyJWTError:
         raise web.HTTPUnauthorized(reason="Invalid token")
+    _token_cache.set(token, username, expires_at=payload.get("exp"))
+    return username
+
+
+async def get_current_user(token: str) -> User:
+    """Получение текущего пользователя по токену"""
+    username = decode_token(token)
+    user = _principal_cache.get(username)
+    if user is not None:
+        return user
     
-    async with async_session() as session:
+    async with read_session() as session:
         result = await session.execute(select(User).where(User.username == username))
         user = result.scalar()
         if user is None:
             raise web.HTTPUnauthorized(reason="User not found")
+        _principal_cache.set(username, user)
         return user
 
 
+def invalidate_user(username: str):
+    """Сброс закешированного пользователя после изменения или удаления"""
+    _principal_cache.pop(username)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target):
+    invalidate_user(target.username)
+    # При переименовании сбрасываем и запись под старым именем
+    for username in inspect(target).attrs.username.history.deleted or ():
+        invalidate_user(username)
+
+
+def auth_cache_stats() -> dict:
+    """Счётчики попаданий/промахов кешей аутентификации"""
+    return {
+        "tokens": _token_cache.stats(),
+        "principals": _principal_cache.stats(),
+    }
+
+
 def require_auth(f):
     """Декоратор для защиты эндпоинтов"""
     @wraps(f)
@@ -66,44 +197,98 @@ def require_auth(f):
         
         token = auth_header.split(' ')[1]
         user = await get_current_user(token)
+        check_rate_limit(request, user)
         request['user'] = user
         return await f(request)
     return decorated_function
 
 
+def is_admin(user) -> bool:
+    return user.username in ADMIN_USERNAMES
+
+
+async def admin_from_request(request):
+    """Администратор из заголовка Authorization или None (без исключений)"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    try:
+        user = await get_current_user(auth_header.split(' ')[1])
+    except web.HTTPUnauthorized:
+        return None
+    return user if is_admin(user) else None
+
+
+def require_admin(f):
+    """Декоратор для служебных эндпоинтов: только пользователи из ADMIN_USERNAMES"""
+    @require_auth
+    @wraps(f)
+    async def decorated_function(request):
+        if not is_admin(request['user']):
+            raise web.HTTPForbidden(reason="Admin access required")
+        return await f(request)
+    return decorated_function
+
+
 async def register_user(user_data: UserCreateSchema) -> User:
-    """Регистрация нового пользователя"""
-    async with async_session() as session:
-        # Проверяем, что пользователь не существует
-        result = await session.execute(
-            select(User).where(
-                (User.username == user_data.username) | (User.email == user_data.email)
-            )
-        )
-        if result.scalar():
+    """Регистрация нового пользователя.
+
+    bcrypt выполняется до транзакции записи: BEGIN IMMEDIATE берёт
+    блокировку SQLite сразу, и хеширование под ней остановило бы всех
+    писателей. Занятость имени проверяется заранее чтением и повторно
+    в транзакции, на случай параллельной регистрации.
+    """
+    taken = (User.username == user_data.username) | (User.email == user_data.email)
+    async with read_session() as session:
+        result = await session.execute(select(User.id).where(taken).limit(1))
+        if result.scalar() is not None:
+            raise web.HTTPConflict(reason="Username or email already exists")
+    
+    hashed_password = await hash_password_async(user_data.password)
+    
+    async def insert_user(session):
+        result = await session.execute(select(User.id).where(taken).limit(1))
+        if result.scalar() is not None:
             raise web.HTTPConflict(reason="Username or email already exists")
-        
-        # Создаем нового пользователя
-        hashed_password = hash_password(user_data.password)
         user = User(
             username=user_data.username,
             email=user_data.email,
             password_hash=hashed_password
         )
         session.add(user)
-        await session.commit()
+        await session.flush()
         return user
+    
+    return await run_write(insert_user)
 
 
 async def authenticate_user(login_data: LoginSchema) -> User:
     """Аутентификация пользователя"""
-    async with async_session() as session:
+    async with read_session() as session:
         result = await session.execute(
             select(User).where(User.username == login_data.username)
         )
         user = result.scalar()
-        
-        if not user or not verify_password(login_data.password, user.password_hash):
-            raise web.HTTPUnauthorized(reason="Invalid username or password")
-        
-        return user
+    
+    if not user or not await verify_password_async(login_data.password, user.password_hash):
+        raise web.HTTPUnauthorized(reason="Invalid username or password")
+    
+    # Прозрачно перехешируем пароль, если изменилась стоимость bcrypt.
+    # Запись идёт через общего писателя; если она не удалась, вход всё равно
+    # успешен — пароль верен, старый хеш перехешируется при следующем входе
+    if password_needs_rehash(user.password_hash):
+        password_hash = await hash_password_async(login_data.password)
+
+        async def store_hash(session):
+            stored_user = await session.get(User, user.id)
+            if stored_user is not None:
+                stored_user.password_hash = password_hash
+
+        try:
+            await run_write(store_hash)
+        except Exception:
+            logger.exception("Password rehash failed for user %s", user.id)
+        else:
+            user.password_hash = password_hash
+    
+    return user
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+from aiohttp import web, WSMsgType
+
+from app.serialization import dump_json
+
+
+# Живая лента объявлений (GET /ads/stream): SSE или WebSocket
+STREAM_BUFFER = int(os.getenv("STREAM_BUFFER", "256"))  # событий на подписчика
+STREAM_HISTORY = int(os.getenv("STREAM_HISTORY", "1024"))  # событий для Last-Event-ID
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", "10000"))
+# Через сколько мс браузерный EventSource переподключается
+STREAM_RETRY_MS = 3000
+
+
+class StreamEvent:
+    """Событие, сериализованное один раз для всех подписчиков"""
+
+    __slots__ = ("seq", "sse", "ws")
+
+    def __init__(self, event_id: str, seq: int, event: str, data: bytes):
+        self.seq = seq
+        self.sse = b"id: %s\nevent: %s\ndata: %s\n\n" % (
+            event_id.encode("ascii"), event.encode("ascii"), data
+        )
+        self.ws = '{"id":"%s","event":"%s","data":%s}' % (event_id, event, data.decode("utf-8"))
+
+
+class Subscriber:
+    """Ограниченный буфер событий одного клиента"""
+
+    __slots__ = ("events", "evicted", "wakeup")
+
+    def __init__(self):
+        self.events = deque()
+        self.evicted = False
+        self.wakeup = asyncio.Event()
+
+    def take(self) -> list:
+        events = list(self.events)
+        self.events.clear()
+        self.wakeup.clear()
+        return events
+
+
+class Broadcaster:
+    """Рассылка событий всем подписчикам процесса.
+
+    Событие сериализуется один раз и раскладывается по буферам подписчиков.
+    Подписчик, чей буфер переполнен, отключается: клиент переподключится
+    с Last-Event-ID и дочитает пропущенное из истории. Идентификатор события —
+    "эпоха-номер"; эпоха меняется при перезапуске процесса, и клиент со
+    старым идентификатором получает событие reset.
+    """
+
+    def __init__(self, buffer: int = STREAM_BUFFER, history: int = STREAM_HISTORY):
+        self.buffer = buffer
+        self.epoch = format(time.time_ns(), "x")
+        self.seq = 0
+        self.published = 0
+        self.evicted = 0
+        self.closed = False
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: str, data: bytes):
+        self.seq += 1
+        self.published += 1
+        item = StreamEvent(f"{self.epoch}-{self.seq}", self.seq, event, data)
+        self._history.append(item)
+        for subscriber in list(self._subscribers):
+            if len(subscriber.events) >= self.buffer:
+                self._evict(subscriber)
+                continue
+            subscriber.events.append(item)
+            subscriber.wakeup.set()
+
+    def subscribe(self, last_event_id: str = None):
+        """Новый подписчик; при last_event_id буфер заполняется пропущенным.
+
+        Возвращает (подписчик, reset): reset означает, что пропущенное
+        восстановить нельзя (вытеснено из истории, не помещается в буфер
+        или идентификатор из другой эпохи) и клиенту надо перечитать ленту.
+        """
+        subscriber = Subscriber()
+        reset = False
+        if last_event_id:
+            missed = self._missed_since(last_event_id)
+            if missed is None or len(missed) > self.buffer:
+                reset = True
+            elif missed:
+                subscriber.events.extend(missed)
+                subscriber.wakeup.set()
+        self._subscribers.add(subscriber)
+        return subscriber, reset
+
+    def _missed_since(self, last_event_id: str):
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self.seq:
+            return None
+        seq = int(seq)
+        oldest = self._history[0].seq if self._history else self.seq + 1
+        if seq + 1 < oldest:
+            return None
+        return [item for item in self._history if item.seq > seq]
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def close(self):
+        """Завершение всех потоков (остановка воркера)"""
+        self.closed = True
+        for subscriber in list(self._subscribers):
+            subscriber.wakeup.set()
+
+    def _evict(self, subscriber: Subscriber):
+        self.evicted += 1
+        subscriber.evicted = True
+        subscriber.events.clear()
+        subscriber.wakeup.set()
+        self._subscribers.discard(subscriber)
+
+
+def publish_ad_event(app, event: str, data):
+    """Публикация изменения объявления в живую ленту (data — схема ответа или dict)"""
+    broadcaster = app.get("broadcaster")
+    if broadcaster is None:
+        return
+    if isinstance(data, dict):
+        payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    else:
+        payload = dump_json(data)
+    broadcaster.publish(event, payload)
+
+
+async def _next_events(subscriber: Subscriber, broadcaster: Broadcaster):
+    """События подписчика; пустой список — пора слать heartbeat, None — конец потока"""
+    try:
+        await asyncio.wait_for(subscriber.wakeup.wait(), STREAM_HEARTBEAT)
+    except asyncio.TimeoutError:
+        pass
+    if subscriber.evicted or broadcaster.closed:
+        return None
+    return subscriber.take()
+
+
+async def sse_stream(request, broadcaster: Broadcaster, subscriber: Subscriber, reset: bool):
+    """Поток Server-Sent Events до отключения клиента или вытеснения"""
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        # Буферизующие прокси (nginx) не должны задерживать события
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+    try:
+        await response.write(b"retry: %d\n\n" % STREAM_RETRY_MS)
+        if reset:
+            await response.write(b"event: reset\ndata: {}\n\n")
+        while (events := await _next_events(subscriber, broadcaster)) is not None:
+            await response.write(b"".join(event.sse for event in events) if events else b": ping\n\n")
+    except ConnectionResetError:
+        pass
+    return response
+
+
+async def ws_stream(request, broadcaster: Broadcaster, subscriber: Subscriber, reset: bool):
+    """Та же лента через WebSocket: сообщения {"id", "event", "data"}"""
+    ws = web.WebSocketResponse(heartbeat=STREAM_HEARTBEAT)
+    await ws.prepare(request)
+
+    async def read_until_closed():
+        # Входящие сообщения не нужны, но чтение обрабатывает close и pong
+        async for message in ws:
+            if message.type == WSMsgType.ERROR:
+                break
+        subscriber.wakeup.set()
+
+    reader = asyncio.create_task(read_until_closed())
+    try:
+        if reset:
+            await ws.send_str('{"event":"reset","data":{}}')
+        while not reader.done():
+            events = await _next_events(subscriber, broadcaster)
+            if events is None or reader.done():
+                break
+            for event in events:
+                await ws.send_str(event.ws)
+    except ConnectionResetError:
+        pass
+    finally:
+        reader.cancel()
+        await ws.close()
+    return ws
+
+
+def setup_broadcast(app):
+    app["broadcaster"] = broadcaster = Broadcaster()
+    app["inflight"].on_drain.append(broadcaster.close)
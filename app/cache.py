@@ -0,0 +1,48 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Ограниченный LRU-кеш с TTL и счётчиками попаданий/промахов"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is not None:
+            value, expires_at = item
+            if expires_at is None or expires_at > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, expires_at: float = None):
+        """Сохранение значения; expires_at — абсолютное время (unix), не позже TTL"""
+        if self.ttl is not None:
+            ttl_expires_at = time.time() + self.ttl
+            if expires_at is None or expires_at > ttl_expires_at:
+                expires_at = ttl_expires_at
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
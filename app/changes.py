@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, literal, String
+
+from app.models import AdTombstone, ChangeSequence
+from app.pagination import stored_datetime
+from app.reads import ads, AD_ROWS
+from app.writer import run_write
+
+logger = logging.getLogger(__name__)
+
+# Размер порции ленты изменений по умолчанию и максимальный
+CHANGES_BATCH = int(os.getenv("CHANGES_BATCH", "500"))
+CHANGES_MAX_BATCH = 5000
+# Сколько хранятся надгробия удалённых объявлений и как часто чистятся
+TOMBSTONE_RETENTION_DAYS = float(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+TOMBSTONE_PURGE_INTERVAL = float(os.getenv("TOMBSTONE_PURGE_INTERVAL", "3600"))
+
+tombstones = AdTombstone.__table__
+sequence = ChangeSequence.__table__
+
+CHANGE_STATE = select(sequence.c.value, sequence.c.purged_seq).where(sequence.c.id == 0)
+
+
+def changed_ads_query(since: int, high: int, limit: int):
+    """Объявления, изменённые после since (строки AD_ROWS + change_seq последним столбцом).
+
+    Верхняя граница high — номер, прочитанный в начале запроса: все
+    изменения до него уже зафиксированы, поэтому токен не перескочит
+    через изменение, которое ещё не было видно.
+    """
+    return (
+        AD_ROWS.add_columns(ads.c.change_seq)
+        .where(ads.c.change_seq > since, ads.c.change_seq <= high)
+        .order_by(ads.c.change_seq)
+        .limit(limit)
+    )
+
+
+def tombstones_query(since: int, high: int, limit: int):
+    return (
+        select(tombstones.c.change_seq, tombstones.c.ad_id)
+        .where(tombstones.c.change_seq > since, tombstones.c.change_seq <= high)
+        .order_by(tombstones.c.change_seq)
+        .limit(limit)
+    )
+
+
+async def purge_tombstones(session, retention_days: float = TOMBSTONE_RETENTION_DAYS) -> int:
+    """Удаление надгробий старше срока хранения; запоминает наибольший удалённый номер"""
+    cutoff = literal(stored_datetime(datetime.utcnow() - timedelta(days=retention_days)), String)
+    expired = tombstones.c.deleted_at < cutoff
+    purged_seq = (await session.execute(
+        select(func.max(tombstones.c.change_seq)).where(expired)
+    )).scalar()
+    if purged_seq is None:
+        return 0
+    await session.execute(
+        sequence.update().where(sequence.c.id == 0)
+        .values(purged_seq=func.max(sequence.c.purged_seq, purged_seq))
+    )
+    result = await session.execute(tombstones.delete().where(expired))
+    return result.rowcount
+
+
+async def _purge_loop():
+    while True:
+        try:
+            purged = await run_write(purge_tombstones)
+            if purged:
+                logger.info("Purged %d expired tombstones", purged)
+        except Exception:
+            logger.exception("Tombstone purge failed")
+        await asyncio.sleep(TOMBSTONE_PURGE_INTERVAL)
+
+
+async def start_tombstone_purge(app):
+    app["tombstone_purge"] = asyncio.create_task(_purge_loop())
+
+
+async def stop_tombstone_purge(app):
+    task = app.get("tombstone_purge")
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import zlib
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:  # brotli — необязательная зависимость
+    brotli = None
+
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Тела меньше порога отдаются как есть: заголовки и CPU дороже экономии
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Тела больше порога сжимаются в пуле потоков, чтобы не блокировать event loop
+COMPRESSION_EXECUTOR_SIZE = int(os.getenv("COMPRESSION_EXECUTOR_SIZE", str(64 * 1024)))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+# Типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+# Кодировки в порядке предпочтения сервера
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _gzip(body: bytes) -> bytes:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def _brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+COMPRESSORS = {"gzip": _gzip, "br": _brotli}
+
+
+def negotiate(request):
+    """Кодировка из Accept-Encoding (с учётом q), None — без сжатия"""
+    accepted = {}
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    best = None
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best is not None else None
+
+
+def compressible(content_type: str, size: int) -> bool:
+    return size >= COMPRESSION_MIN_SIZE and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+async def compress(body: bytes, encoding: str) -> bytes:
+    """Сжатие тела; большие тела — в пуле потоков (zlib и brotli отпускают GIL)"""
+    compressor = COMPRESSORS[encoding]
+    if len(body) > COMPRESSION_EXECUTOR_SIZE:
+        return await asyncio.get_running_loop().run_in_executor(None, compressor, body)
+    return compressor(body)
+
+
+def add_vary(response):
+    vary = response.headers.get("Vary")
+    if not vary:
+        response.headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        response.headers["Vary"] = f"{vary}, Accept-Encoding"
+
+
+@web.middleware
+async def compression_middleware(request, handler):
+    """Сжатие готовых тел ответов по Accept-Encoding.
+
+    Ответы из кеша приходят уже сжатыми (варианты хранятся рядом с телом),
+    потоковые ответы (выгрузка) не трогаются.
+    """
+    response = await handler(request)
+    if (not isinstance(response, web.Response) or response.prepared
+            or not isinstance(response.body, bytes)
+            or "Content-Encoding" in response.headers):
+        return response
+    if not compressible(response.content_type, len(response.body)):
+        return response
+    add_vary(response)
+    encoding = negotiate(request)
+    if encoding is None:
+        return response
+    response.body = await compress(response.body, encoding)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def setup_compression(app):
+    app["compression"] = COMPRESSION_ENABLED
+    if COMPRESSION_ENABLED:
+        app.middlewares.append(compression_middleware)
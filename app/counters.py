@@ -0,0 +1,32 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models import AdCounter, TOTAL_ADS_KEY
+
+
+async def change_ad_counts(session, deltas: dict):
+    """Изменение счётчиков владельцев {owner_id: delta} и общего счётчика одним запросом"""
+    deltas = {owner_id: delta for owner_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    rows = [{'owner_id': TOTAL_ADS_KEY, 'ad_count': sum(deltas.values())}]
+    rows.extend({'owner_id': owner_id, 'ad_count': delta} for owner_id, delta in deltas.items())
+    stmt = insert(AdCounter).values(rows)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[AdCounter.owner_id],
+        set_={'ad_count': AdCounter.ad_count + stmt.excluded.ad_count}
+    ))
+
+
+async def change_ad_count(session, owner_id: int, delta: int):
+    """Изменение общего счётчика и счётчика владельца в текущей транзакции"""
+    await change_ad_counts(session, {owner_id: delta})
+
+
+async def get_ad_count(session, owner_id: int = None) -> int:
+    """Количество объявлений (всего или у владельца) без COUNT(*) по таблице"""
+    key = TOTAL_ADS_KEY if owner_id is None else owner_id
+    result = await session.execute(
+        select(AdCounter.ad_count).where(AdCounter.owner_id == key)
+    )
+    return result.scalar() or 0
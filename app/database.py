@@ -1,18 +1,139 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.metrics import metrics, METRICS_ENABLED
 import os
+import time
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./data/ads.db")
+# Логирование всех SQL-запросов — только по запросу
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() in ("1", "true", "yes")
+
+# Профиль SQLite для продакшена: WAL, облегчённый fsync, mmap и кеш страниц,
+# отдельный пул только для чтения и единственный писатель (см. app.writer)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # < 0 — в КиБ
+SQLITE_BUSY_TIMEOUT = 30
+DATABASE_READ_POOL_SIZE = int(os.getenv("DATABASE_READ_POOL_SIZE", "8"))
+DATABASE_WRITE_POOL_SIZE = int(os.getenv("DATABASE_WRITE_POOL_SIZE", "4"))
+
+url = make_url(DATABASE_URL)
+is_sqlite = url.get_backend_name() == "sqlite"
+is_file_sqlite = is_sqlite and url.database not in (None, "", ":memory:")
+
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, измеряющий ожидание свободного соединения при checkout"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe_pool_wait(self.logging_name, time.perf_counter() - started)
+
+
+pool_class = TimedQueuePool if METRICS_ENABLED else AsyncAdaptedQueuePool
+
+# aiosqlite по умолчанию открывает новое соединение (и поток) на каждую
+# сессию; для файловой базы держим постоянный пул
+pool_options = {"poolclass": pool_class} if is_file_sqlite else {}
 
 engine = create_async_engine(
     DATABASE_URL,
     connect_args={
         "check_same_thread": False,
-        "timeout": 30
+        "timeout": SQLITE_BUSY_TIMEOUT
     },
-    pool_pre_ping=True,
-    echo=True
+    # Локальный файл SQLite не «протухает», как сетевое соединение: проверка
+    # при выдаче из пула была бы лишним обращением к потоку aiosqlite
+    pool_pre_ping=not is_sqlite,
+    pool_logging_name="write",
+    echo=DATABASE_ECHO,
+    **(dict(pool_options, pool_size=DATABASE_WRITE_POOL_SIZE) if pool_options else {})
 )
 
+if is_file_sqlite and DATABASE_READ_POOL_SIZE > 0:
+    # Соединения только для чтения: в WAL читатели не блокируют писателя
+    read_engine = create_async_engine(
+        url.set(database=f"file:{url.database}", query={**url.query, "mode": "ro", "uri": "true"}),
+        connect_args={
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT
+        },
+        poolclass=pool_class,
+        pool_size=DATABASE_READ_POOL_SIZE,
+        pool_logging_name="read",
+        echo=DATABASE_ECHO
+    )
+else:
+    read_engine = engine
+
+
+def _apply_pragmas(dbapi_connection, writer: bool):
+    cursor = dbapi_connection.cursor()
+    if writer:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.close()
+
+
+if is_sqlite:
+    # Транзакциями управляем сами (BEGIN/SAVEPOINT): драйвер sqlite3
+    # иначе откладывает BEGIN и ломает вложенные транзакции
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        _apply_pragmas(dbapi_connection, writer=True)
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _on_begin(conn):
+        # Блокировка записи берётся сразу, а не при первом INSERT
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    if read_engine is not engine:
+        @event.listens_for(read_engine.sync_engine, "connect")
+        def _on_read_connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+            _apply_pragmas(dbapi_connection, writer=False)
+
+        @event.listens_for(read_engine.sync_engine, "begin")
+        def _on_read_begin(conn):
+            # Один снимок WAL на всю транзакцию чтения
+            conn.exec_driver_sql("BEGIN")
+
+
+def _instrument(target, name: str):
+    """Время каждого запроса к БД: гистограмма, счёт на HTTP-запрос, журнал медленных"""
+    @event.listens_for(target.sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(target.sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        metrics.observe_query(name, time.perf_counter() - started, statement)
+
+    @event.listens_for(target.sync_engine, "handle_error")
+    def _on_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+if METRICS_ENABLED:
+    _instrument(engine, "write")
+    if read_engine is not engine:
+        _instrument(read_engine, "read")
+
 async_session = sessionmaker(engine, expire_on_commit=False,
                              class_=AsyncSession)
+read_session = sessionmaker(read_engine, expire_on_commit=False,
+                            class_=AsyncSession)
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+
+from aiohttp import hdrs, BodyPartReader
+from aiohttp.http_exceptions import HttpProcessingError
+
+from app.request_body import InvalidBody, too_large
+
+
+# Изображения объявлений хранятся на диске под именем sha256 содержимого:
+# одинаковые файлы не дублируются, а URL не меняется, пока не меняется файл
+IMAGES_DIR = os.getenv("IMAGES_DIR", "./data/images")
+IMAGE_URL_PREFIX = "/images/"
+MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", str(5 * 1024 * 1024)))
+MAX_IMAGES_PER_AD = int(os.getenv("MAX_IMAGES_PER_AD", "10"))
+# Порция чтения части multipart и записи на диск
+IMAGE_CHUNK_SIZE = 64 * 1024
+# Запас на заголовки частей и границы multipart при проверке Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+IMAGE_FIELD = "image"
+
+# Допустимые типы и расширения файлов; тип определяется по сигнатуре
+# содержимого, заявленный клиентом Content-Type должен с ней совпадать
+IMAGE_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+EXTENSION_TYPES = {extension: content_type for content_type, extension in IMAGE_TYPES.items()}
+GENERIC_CONTENT_TYPE = "application/octet-stream"
+SIGNATURE_BYTES = 12
+
+# Чем MultipartReader сообщает о повреждённом теле: нет границы, битые
+# заголовки части, обрыв тела
+MULTIPART_ERRORS = (ValueError, AssertionError, HttpProcessingError)
+
+# Имя файла в URL: /images/<sha256>.<расширение>
+IMAGE_NAME_PATTERN = r"[0-9a-f]{64}\.(?:jpg|png|gif|webp)"
+# Содержимое по URL не меняется, клиенты и CDN могут кешировать его бессрочно
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def sniff_image_type(head: bytes):
+    """Тип изображения по первым байтам файла (None — не изображение)"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def image_path(filename: str) -> str:
+    """Путь к файлу: каталоги по первым символам хеша, чтобы не копить файлы в одном"""
+    return os.path.join(IMAGES_DIR, filename[:2], filename)
+
+
+def image_headers(filename: str) -> dict:
+    """Заголовки ответа с файлом; тип — по расширению, без mimetypes"""
+    return {
+        "Content-Type": EXTENSION_TYPES[os.path.splitext(filename)[1]],
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "X-Content-Type-Options": "nosniff",
+    }
+
+
+def image_urls(filenames) -> list:
+    """URL изображений из group_concat имён файлов (см. app.reads)"""
+    return [IMAGE_URL_PREFIX + name for name in filenames.split()] if filenames else []
+
+
+def unsupported_type() -> InvalidBody:
+    return InvalidBody(415, {"error": "Unsupported image type", "allowed": list(IMAGE_TYPES)})
+
+
+def too_many_images() -> InvalidBody:
+    return InvalidBody(400, {"error": "Too many images", "max_images": MAX_IMAGES_PER_AD})
+
+
+class UploadedImage:
+    """Принятый файл во временном каталоге, ещё не опубликованный"""
+
+    __slots__ = ("temp_path", "filename", "content_type", "size")
+
+    def __init__(self, temp_path: str, filename: str, content_type: str, size: int):
+        self.temp_path = temp_path
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+
+
+def _open_temp_file():
+    temp_dir = os.path.join(IMAGES_DIR, "tmp")
+    os.makedirs(temp_dir, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=temp_dir, delete=False)
+
+
+def _check_type(declared: str, head: bytes) -> str:
+    content_type = sniff_image_type(head)
+    if content_type is None or declared not in (content_type, GENERIC_CONTENT_TYPE):
+        raise unsupported_type()
+    return content_type
+
+
+async def _receive_part(part: BodyPartReader) -> UploadedImage:
+    """Запись части на диск порциями: размер и тип проверяются по ходу чтения"""
+    declared = part.headers.get(hdrs.CONTENT_TYPE, GENERIC_CONTENT_TYPE).split(";")[0].strip().lower()
+    if declared not in IMAGE_TYPES and declared != GENERIC_CONTENT_TYPE:
+        raise unsupported_type()
+
+    loop = asyncio.get_running_loop()
+    file = await loop.run_in_executor(None, _open_temp_file)
+    digest = hashlib.sha256()
+    head = b""
+    content_type = None
+    size = 0
+    try:
+        while chunk := await part.read_chunk(IMAGE_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_IMAGE_SIZE:
+                raise too_large(MAX_IMAGE_SIZE)
+            if content_type is None:
+                head += chunk[:SIGNATURE_BYTES - len(head)]
+                if len(head) == SIGNATURE_BYTES:
+                    content_type = _check_type(declared, head)
+            digest.update(chunk)
+            await loop.run_in_executor(None, file.write, chunk)
+        if content_type is None:
+            # Файл короче сигнатуры
+            content_type = _check_type(declared, head)
+        await loop.run_in_executor(None, file.close)
+    except BaseException:
+        await loop.run_in_executor(None, _discard, file)
+        raise
+    filename = digest.hexdigest() + IMAGE_TYPES[content_type]
+    return UploadedImage(file.name, filename, content_type, size)
+
+
+def _discard(file):
+    file.close()
+    os.unlink(file.name)
+
+
+async def receive_images(request, max_files: int) -> list:
+    """Файлы из multipart/form-data (поля image) во временном каталоге.
+
+    Тело не буферизуется: каждая часть пишется на диск по мере чтения.
+    При любой ошибке уже принятые файлы удаляются; на постоянные пути
+    их переносит publish_images.
+    """
+    if request.content_type != "multipart/form-data":
+        raise InvalidBody(415, {"error": "Expected multipart/form-data"})
+    max_bytes = max_files * MAX_IMAGE_SIZE + MULTIPART_OVERHEAD
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise too_large(max_bytes)
+
+    images = []
+    try:
+        reader = await request.multipart()
+        while (part := await reader.next()) is not None:
+            if not isinstance(part, BodyPartReader) or part.name != IMAGE_FIELD or not part.filename:
+                raise InvalidBody(400, {"error": f"Expected file fields named '{IMAGE_FIELD}'"})
+            if len(images) >= max_files:
+                raise too_many_images()
+            images.append(await _receive_part(part))
+    except MULTIPART_ERRORS:
+        await discard_images(images)
+        raise InvalidBody(400, {"error": "Invalid multipart body"})
+    except BaseException:
+        await discard_images(images)
+        raise
+    if not images:
+        raise InvalidBody(400, {"error": "No images in request"})
+    return images
+
+
+def _publish(image: UploadedImage):
+    path = image_path(image.filename)
+    if os.path.exists(path):
+        # Такой файл уже есть; его mtime (и ETag ответа) не трогаем
+        os.unlink(image.temp_path)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.chmod(image.temp_path, 0o644)
+    os.replace(image.temp_path, path)
+
+
+async def publish_images(images: list):
+    """Перенос принятых файлов на постоянные пути (rename в пределах IMAGES_DIR).
+
+    Выполняется до записи в БД: URL из ответа сразу отдаёт файл. Если запись
+    не удалась, файл остаётся без ссылок — повторная загрузка найдёт его.
+    """
+    loop = asyncio.get_running_loop()
+    for image in images:
+        await loop.run_in_executor(None, _publish, image)
+
+
+async def discard_images(images: list):
+    loop = asyncio.get_running_loop()
+    for image in images:
+        await loop.run_in_executor(None, _unlink_quietly, image.temp_path)
+
+
+def _unlink_quietly(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
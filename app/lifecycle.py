@@ -0,0 +1,66 @@
+import asyncio
+
+from aiohttp import web
+
+
+class InflightRequests:
+    """Счётчик обрабатываемых запросов для мягкой остановки воркера"""
+
+    def __init__(self):
+        self.count = 0
+        self.draining = False
+        # Вызываются в начале остановки: долгие потоки (SSE, WebSocket) завершаются сами
+        self.on_drain = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def enter(self):
+        self.count += 1
+        self._idle.clear()
+
+    def leave(self):
+        self.count -= 1
+        if self.count == 0:
+            self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Ожидание завершения текущих запросов; False, если вышло время"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+@web.middleware
+async def inflight_middleware(request, handler):
+    inflight = request.app["inflight"]
+    inflight.enter()
+    try:
+        response = await handler(request)
+        if inflight.draining and not response.prepared:
+            # Keep-alive соединение закрывается после ответа
+            response.force_close()
+        return response
+    finally:
+        inflight.leave()
+
+
+async def drain(runner: web.AppRunner, timeout: float) -> bool:
+    """Остановка приёма соединений и ожидание текущих запросов.
+
+    aiohttp при runner.cleanup() отменяет незавершённые обработчики,
+    поэтому сначала закрываются сокеты и дорабатывает то, что уже принято.
+    """
+    inflight = runner.app["inflight"]
+    inflight.draining = True
+    for callback in inflight.on_drain:
+        callback()
+    for site in list(runner.sites):
+        await site.stop()
+    return await inflight.wait_idle(timeout)
+
+
+def setup_inflight(app):
+    app["inflight"] = InflightRequests()
+    app.middlewares.append(inflight_middleware)
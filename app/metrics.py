@@ -0,0 +1,230 @@
+import bisect
+import contextlib
+import contextvars
+import logging
+import os
+import time
+
+from aiohttp import web
+
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Порог медленного запроса к БД, мс (0 — журнал отключён)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Сколько символов SQL попадает в журнал медленных запросов
+SLOW_QUERY_SQL_CHARS = 1000
+
+# Границы корзин гистограмм, секунды / штуки
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Маршрут для запросов, не попавших ни в один ресурс (не плодим метки из URL)
+UNMATCHED_ROUTE = "unmatched"
+
+slow_query_logger = logging.getLogger("app.slow_query")
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами в формате Prometheus"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: dict):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+        yield f"{name}_bucket", {**labels, "le": "+Inf"}, self.count
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+class RequestDbStats:
+    """Запросы к БД в рамках одного HTTP-запроса"""
+
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Текущий HTTP-запрос; события движка выполняются в том же контексте
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+def current_request_db():
+    """Счётчик БД текущего HTTP-запроса (None вне запроса)"""
+    return _request_db.get()
+
+
+@contextlib.contextmanager
+def request_db_scope(db):
+    """Запросы внутри блока относятся к HTTP-запросу db (например, из очереди записи)"""
+    token = _request_db.set(db)
+    try:
+        yield
+    finally:
+        _request_db.reset(token)
+
+
+class Metrics:
+    """Счётчики процесса: HTTP, запросы к БД и ожидание пула соединений"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests = {}
+        self.latency = {}
+        self.request_queries = {}
+        self.request_db_seconds = {}
+        self.queries = {}
+        self.slow_queries = {}
+        self.pool_wait = {}
+
+    def observe_request(self, route: str, method: str, status: int, seconds: float, db):
+        key = (route, method, f"{status // 100}xx")
+        self.requests[key] = self.requests.get(key, 0) + 1
+        route_key = (route, method)
+        _histogram(self.latency, route_key, LATENCY_BUCKETS).observe(seconds)
+        _histogram(self.request_queries, route_key, QUERY_COUNT_BUCKETS).observe(db.queries)
+        _histogram(self.request_db_seconds, route_key, LATENCY_BUCKETS).observe(db.seconds)
+
+    def observe_query(self, engine_name: str, seconds: float, statement: str):
+        _histogram(self.queries, engine_name, QUERY_BUCKETS).observe(seconds)
+        db = _request_db.get()
+        if db is not None:
+            db.queries += 1
+            db.seconds += seconds
+        if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+            self.slow_queries[engine_name] = self.slow_queries.get(engine_name, 0) + 1
+            slow_query_logger.warning(
+                "Slow query on %s engine: %.1f ms: %s",
+                engine_name, seconds * 1000, " ".join(statement.split())[:SLOW_QUERY_SQL_CHARS]
+            )
+
+    def observe_pool_wait(self, engine_name: str, seconds: float):
+        _histogram(self.pool_wait, engine_name, LATENCY_BUCKETS).observe(seconds)
+
+    def render(self, extra=()) -> str:
+        """Текстовый формат Prometheus.
+
+        extra — метрики других подсистем: [(имя, тип, справка, значения)],
+        где значения — число или {((метка, значение), ...): число}.
+        """
+        lines = []
+        _family(lines, "http_requests_total", "counter", "HTTP requests by route and status class",
+                ((("route", "method", "status"), key, value) for key, value in self.requests.items()))
+        for name, help_text, histograms in (
+            ("http_request_duration_seconds", "Request latency", self.latency),
+            ("http_request_db_queries", "DB queries per request", self.request_queries),
+            ("http_request_db_seconds", "DB time per request", self.request_db_seconds),
+        ):
+            _histogram_family(lines, name, help_text, ("route", "method"), histograms)
+        _histogram_family(lines, "db_query_duration_seconds", "DB query latency",
+                          ("engine",), self.queries)
+        _family(lines, "db_slow_queries_total", "counter", f"Queries slower than {SLOW_QUERY_MS:g} ms",
+                ((("engine",), (key,), value) for key, value in self.slow_queries.items()))
+        _histogram_family(lines, "db_pool_checkout_wait_seconds", "Connection pool checkout wait",
+                          ("engine",), self.pool_wait)
+        _family(lines, "process_start_time_seconds", "gauge", "Process start time",
+                [((), (), self.started_at)])
+        for name, metric_type, help_text, values in extra:
+            _family(lines, name, metric_type, help_text,
+                    ((tuple(labels), tuple(labels.values()), value)
+                     for labels, value in _extra_items(values)))
+        return "\n".join(lines) + "\n"
+
+
+def _histogram(histograms: dict, key, buckets) -> Histogram:
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = Histogram(buckets)
+    return histogram
+
+
+def _extra_items(values):
+    if isinstance(values, dict):
+        return ((dict(labels), value) for labels, value in values.items())
+    return [({}, values)]
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name: str, labels: dict, value) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def _family(lines, name, metric_type, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for label_names, label_values, value in samples:
+        lines.append(_sample(name, dict(zip(label_names, label_values)), value))
+
+
+def _histogram_family(lines, name, help_text, label_names, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in histograms.items():
+        labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+        for sample_name, sample_labels, value in histogram.samples(name, labels):
+            lines.append(_sample(sample_name, sample_labels, value))
+
+
+metrics = Metrics()
+
+
+def route_name(request) -> str:
+    """Шаблон маршрута ("/ads/{ad_id}") вместо конкретного URL"""
+    route = request.match_info.route
+    resource = route.resource if route is not None else None
+    return resource.canonical if resource is not None else UNMATCHED_ROUTE
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    db = RequestDbStats()
+    token = _request_db.set(db)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        _request_db.reset(token)
+        metrics.observe_request(
+            route_name(request), request.method, status, time.perf_counter() - started, db
+        )
+
+
+def setup_metrics(app):
+    if METRICS_ENABLED:
+        app.middlewares.append(metrics_middleware)
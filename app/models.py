@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, func, ForeignKey
+from sqlalchemy import (
+    Column, Integer, String, Text, DateTime, func, ForeignKey, Index, select, literal, inspect,
+    text
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -26,6 +29,214 @@ class Advertisement(Base):
     description = Column(Text, nullable=False)
     created_at = Column(DateTime, server_default=func.now())
     owner_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # Номер последнего изменения (лента /ads/changes), назначается триггерами
+    change_seq = Column(Integer, index=True)
     
     # Связь с пользователем
     owner_user = relationship("User", back_populates="advertisements")
+
+    __table_args__ = (
+        # Keyset-пагинация ленты: ORDER BY created_at DESC, id DESC
+        Index('ix_advertisements_created_at_id', 'created_at', 'id'),
+        # Лента пользователя и фильтр по владельцу: owner_id = ? с тем же порядком
+        Index('ix_advertisements_owner_created_at_id', 'owner_id', 'created_at', 'id'),
+    )
+
+
+class AdImage(Base):
+    """Изображение объявления; файл на диске назван по sha256 содержимого"""
+    __tablename__ = 'ad_images'
+
+    id = Column(Integer, primary_key=True)
+    ad_id = Column(Integer, ForeignKey('advertisements.id'), nullable=False)
+    filename = Column(String(80), nullable=False)  # <sha256>.<расширение>
+    content_type = Column(String(50), nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        # Изображения объявления в порядке загрузки
+        Index('ix_ad_images_ad_id_id', 'ad_id', 'id'),
+    )
+
+
+# Ключ строки с общим количеством объявлений в ad_counters
+TOTAL_ADS_KEY = 0
+
+
+class AdCounter(Base):
+    """Поддерживаемые счётчики объявлений: общий (owner_id = 0) и по владельцам"""
+    __tablename__ = 'ad_counters'
+
+    owner_id = Column(Integer, primary_key=True, autoincrement=False)
+    ad_count = Column(Integer, nullable=False, default=0)
+
+
+class ChangeSequence(Base):
+    """Счётчик изменений объявлений (единственная строка id = 0).
+
+    purged_seq — наибольший номер удалённого по сроку хранения надгробия:
+    токены старше него уже не могут получить все удаления.
+    """
+    __tablename__ = 'ad_change_sequence'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    value = Column(Integer, nullable=False, default=0)
+    purged_seq = Column(Integer, nullable=False, default=0)
+
+
+class AdTombstone(Base):
+    """Надгробие удалённого объявления для ленты изменений"""
+    __tablename__ = 'ad_tombstones'
+
+    ad_id = Column(Integer, primary_key=True, autoincrement=False)
+    change_seq = Column(Integer, nullable=False, index=True)
+    deleted_at = Column(DateTime, server_default=func.now(), index=True)
+
+
+def reseed_ad_counters(connection):
+    """Пересчёт счётчиков по фактическому содержимому таблицы объявлений"""
+    counters = AdCounter.__table__
+    ads = Advertisement.__table__
+    connection.execute(counters.delete())
+    connection.execute(counters.insert().from_select(
+        ['owner_id', 'ad_count'],
+        select(literal(TOTAL_ADS_KEY), func.count()).select_from(ads)
+    ))
+    connection.execute(counters.insert().from_select(
+        ['owner_id', 'ad_count'],
+        select(ads.c.owner_id, func.count()).group_by(ads.c.owner_id)
+    ))
+
+
+# Полнотекстовый индекс FTS5 по заголовку и описанию (external content:
+# текст хранится только в advertisements), синхронизируется триггерами
+ADS_FTS_TABLE = 'ads_fts'
+ADS_FTS_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS ads_fts USING fts5(
+        title, description,
+        content='advertisements', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS advertisements_fts_insert
+    AFTER INSERT ON advertisements BEGIN
+        INSERT INTO ads_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS advertisements_fts_delete
+    AFTER DELETE ON advertisements BEGIN
+        INSERT INTO ads_fts(ads_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS advertisements_fts_update
+    AFTER UPDATE OF title, description ON advertisements BEGIN
+        INSERT INTO ads_fts(ads_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO ads_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+)
+
+
+# Номер изменения назначается в той же транзакции, что и запись: создание,
+# правка и удаление объявления увеличивают счётчик, удаление оставляет
+# надгробие, а повторно использованный id его снимает
+NEXT_CHANGE_SEQ = """
+        UPDATE ad_change_sequence SET value = value + 1 WHERE id = 0;"""
+CURRENT_CHANGE_SEQ = "(SELECT value FROM ad_change_sequence WHERE id = 0)"
+CHANGE_FEED_DDL = (
+    f"""CREATE TRIGGER IF NOT EXISTS advertisements_change_insert
+    AFTER INSERT ON advertisements BEGIN{NEXT_CHANGE_SEQ}
+        UPDATE advertisements SET change_seq = {CURRENT_CHANGE_SEQ} WHERE id = new.id;
+        DELETE FROM ad_tombstones WHERE ad_id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS advertisements_change_update
+    AFTER UPDATE OF title, description, owner_id ON advertisements BEGIN{NEXT_CHANGE_SEQ}
+        UPDATE advertisements SET change_seq = {CURRENT_CHANGE_SEQ} WHERE id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS advertisements_change_delete
+    AFTER DELETE ON advertisements BEGIN{NEXT_CHANGE_SEQ}
+        INSERT OR REPLACE INTO ad_tombstones(ad_id, change_seq, deleted_at)
+        VALUES (old.id, {CURRENT_CHANGE_SEQ}, CURRENT_TIMESTAMP);
+    END""",
+    # Новое изображение меняет ответ объявления, и оно снова попадает в ленту
+    f"""CREATE TRIGGER IF NOT EXISTS ad_images_change_insert
+    AFTER INSERT ON ad_images BEGIN{NEXT_CHANGE_SEQ}
+        UPDATE advertisements SET change_seq = {CURRENT_CHANGE_SEQ} WHERE id = new.ad_id;
+    END""",
+)
+
+# Записи об изображениях удаляются вместе с объявлением (внешние ключи
+# SQLite не включены). Файлы остаются: один файл может принадлежать
+# нескольким объявлениям.
+AD_IMAGES_DDL = (
+    """CREATE TRIGGER IF NOT EXISTS advertisements_images_delete
+    AFTER DELETE ON advertisements BEGIN
+        DELETE FROM ad_images WHERE ad_id = old.id;
+    END""",
+)
+
+
+def add_missing_columns(connection):
+    """Новые nullable-колонки моделей в таблицах уже существующей БД"""
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(connection.dialect)
+                connection.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                ))
+
+
+def create_change_feed(connection) -> bool:
+    """Строка счётчика и триггеры ленты изменений; True, если лента создана сейчас"""
+    sequence = ChangeSequence.__table__
+    created = connection.execute(
+        select(sequence.c.id).where(sequence.c.id == 0)
+    ).first() is None
+    if created:
+        connection.execute(sequence.insert().values(id=0, value=0, purged_seq=0))
+    for statement in CHANGE_FEED_DDL:
+        connection.execute(text(statement))
+    return created
+
+
+def backfill_change_seq(connection):
+    """Номера изменений для объявлений, созданных до появления ленты"""
+    ads = Advertisement.__table__
+    connection.execute(ads.update().where(ads.c.change_seq.is_(None)).values(change_seq=ads.c.id))
+    connection.execute(ChangeSequence.__table__.update().values(
+        value=select(func.coalesce(func.max(ads.c.change_seq), 0)).scalar_subquery()
+    ))
+
+
+def create_search_index(connection) -> bool:
+    """Создание FTS-таблицы и триггеров; True, если таблица создана сейчас"""
+    created = not inspect(connection).has_table(ADS_FTS_TABLE)
+    for statement in ADS_FTS_DDL:
+        connection.execute(text(statement))
+    return created
+
+
+def rebuild_search_index(connection):
+    """Полная перестройка FTS-индекса по содержимому advertisements"""
+    connection.execute(text("INSERT INTO ads_fts(ads_fts) VALUES ('rebuild')"))
+
+
+def create_schema(connection):
+    """Создание таблиц и недостающих индексов (в т.ч. в уже существующей БД)"""
+    Base.metadata.create_all(connection)
+    add_missing_columns(connection)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    reseed_ad_counters(connection)
+    if create_search_index(connection):
+        # Индекс добавлен в базу, где уже есть объявления
+        rebuild_search_index(connection)
+    if create_change_feed(connection):
+        backfill_change_seq(connection)
+    for statement in AD_IMAGES_DDL:
+        connection.execute(text(statement))
@@ -0,0 +1,122 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import String, tuple_, literal, type_coerce
+
+from app.reads import ads, AD_ROWS
+
+
+# Сырое значение created_at в том виде, в каком оно хранится в БД.
+# Курсор сравнивается именно с ним, чтобы значения, записанные через
+# CURRENT_TIMESTAMP ("YYYY-MM-DD HH:MM:SS"), и значения с микросекундами
+# сравнивались корректно и поиск шёл по индексу (created_at, id).
+created_at_raw = type_coerce(ads.c.created_at, String).label('created_at_raw')
+
+# Порядок выдачи: новые объявления первыми, id разрешает совпадения времени
+ADS_ORDER = (ads.c.created_at.desc(), ads.c.id.desc())
+
+
+class InvalidCursor(ValueError):
+    """Курсор не удалось разобрать"""
+
+
+def stored_datetime(value: datetime) -> str:
+    """datetime в текстовом формате хранения SQLite (CURRENT_TIMESTAMP, UTC)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return str(value)
+
+
+def _pack(position) -> str:
+    raw = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _unpack(cursor: str, key_type):
+    """Пара (ключ сортировки, id) из курсора с проверкой типов"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key, ad_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeEncodeError):
+        raise InvalidCursor(cursor)
+    if (not isinstance(key, key_type) or isinstance(key, bool)
+            or not isinstance(ad_id, int) or isinstance(ad_id, bool)):
+        raise InvalidCursor(cursor)
+    return key, ad_id
+
+
+def encode_cursor(created_at, ad_id: int) -> str:
+    """Упаковка позиции (created_at, id) в непрозрачный курсор"""
+    if isinstance(created_at, datetime):
+        created_at = stored_datetime(created_at)
+    return _pack([created_at, ad_id])
+
+
+def decode_cursor(cursor: str):
+    """Распаковка курсора в пару (created_at, id)"""
+    return _unpack(cursor, str)
+
+
+def encode_search_cursor(score: float, ad_id: int) -> str:
+    """Курсор поисковой выдачи: позиция (bm25, id)"""
+    return _pack([score, ad_id])
+
+
+def decode_search_cursor(cursor: str):
+    score, ad_id = _unpack(cursor, (int, float))
+    return float(score), ad_id
+
+
+def encode_change_token(seq: int) -> str:
+    """Токен ленты изменений: все изменения с номером <= seq уже получены"""
+    return _pack(["changes", seq])
+
+
+def decode_change_token(token: str) -> int:
+    key, seq = _unpack(token, str)
+    if key != "changes" or seq < 0:
+        raise InvalidCursor(token)
+    return seq
+
+
+def after_cursor(created_at: str, ad_id: int):
+    """Условие keyset-поиска: объявления строго после позиции курсора"""
+    return tuple_(ads.c.created_at, ads.c.id) < tuple_(
+        literal(created_at, String), literal(ad_id)
+    )
+
+
+def ads_filters(owner_id=None, created_after=None, created_before=None):
+    """Условия выборки ленты: владелец и полуоткрытый интервал по created_at.
+
+    Границы сравниваются с хранимым текстом, поэтому оба условия ложатся
+    в диапазон индекса (created_at, id) или (owner_id, created_at, id).
+    """
+    conditions = []
+    if owner_id is not None:
+        conditions.append(ads.c.owner_id == owner_id)
+    if created_after is not None:
+        conditions.append(ads.c.created_at > literal(stored_datetime(created_after), String))
+    if created_before is not None:
+        conditions.append(ads.c.created_at < literal(stored_datetime(created_before), String))
+    return conditions
+
+
+def ads_page_query(per_page: int, conditions=(), position=None, offset: int = 0):
+    """Страница ленты (+1 строка, чтобы узнать, есть ли продолжение).
+
+    Строки AD_ROWS (объявление с владельцем) и последним столбцом
+    created_at_raw для курсора.
+    """
+    query = (
+        AD_ROWS.add_columns(created_at_raw)
+        .where(*conditions)
+        .order_by(*ADS_ORDER)
+        .limit(per_page + 1)
+    )
+    if position is not None:
+        query = query.where(after_cursor(*position))
+    elif offset:
+        query = query.offset(offset)
+    return query
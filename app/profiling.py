@@ -0,0 +1,175 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+from collections import Counter
+
+from aiohttp import web
+
+from app.auth import admin_from_request
+from app.metrics import route_name
+
+
+# Профилирование по запросу: доля случайных запросов (0 — выключено)
+# и/или заголовок X-Profile от администратора
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/profiles")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")  # cprofile | sampler
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLER_INTERVAL = float(os.getenv("PROFILE_SAMPLER_INTERVAL", "0.005"))
+PROFILE_HEADER = "X-Profile"
+PROFILE_MODES = ("cprofile", "sampler")
+
+
+def collapse_stack(frame) -> str:
+    """Стек в формате collapsed stacks (flamegraph.pl, speedscope): корень первым"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Периодические снимки стека потока event loop из отдельного потока"""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLER_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+
+def profile_name(method: str, route: str) -> str:
+    """Имя файла профиля для маршрута: "GET /ads/{ad_id}" -> "GET_ads_ad_id" """
+    return re.sub(r"[^A-Za-z0-9]+", "_", f"{method} {route}").strip("_")
+
+
+class Profiler:
+    """Профили запросов, накопленные по маршрутам.
+
+    Одновременно профилируется один запрос: и cProfile, и сэмплер видят
+    весь поток event loop, поэтому в профиль попадает и работа соседних
+    запросов, выполнявшаяся, пока профилируемый ждал ввода-вывода.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, mode: str = PROFILE_MODE,
+                 rate: float = PROFILE_SAMPLE_RATE):
+        self.directory = directory
+        self.mode = mode
+        self.rate = rate
+        self.profiled = Counter()
+        self.skipped = 0
+        self._busy = False
+        self._stats = {}
+        self._stacks = {}
+
+    def sampled(self) -> bool:
+        return self.rate > 0 and random.random() < self.rate
+
+    def state(self) -> dict:
+        return {
+            "mode": self.mode, "rate": self.rate, "directory": os.path.abspath(self.directory),
+            "profiled": dict(self.profiled), "skipped": self.skipped,
+        }
+
+    async def profile(self, request, handler, mode: str, report: bool = False):
+        """Профилирование запроса; имя файла профиля отдаётся в X-Profile-File
+        только при report — запросах администратора с X-Profile, не случайных"""
+        if self._busy:
+            self.skipped += 1
+            return await handler(request)
+        self._busy = True
+        name = profile_name(request.method, route_name(request))
+        try:
+            if mode == "sampler":
+                sampler = StackSampler(threading.get_ident())
+                sampler.start()
+                try:
+                    response = await handler(request)
+                finally:
+                    sampler.stop()
+                self._stacks.setdefault(name, Counter()).update(sampler.stacks)
+                path = await self._save(self._write_stacks, name)
+            else:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # Активен другой профилировщик (sys.monitoring в 3.12+)
+                    self.skipped += 1
+                    return await handler(request)
+                try:
+                    response = await handler(request)
+                finally:
+                    profile.disable()
+                stats = self._stats.get(name)
+                if stats is None:
+                    self._stats[name] = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+                path = await self._save(self._write_pstats, name)
+            self.profiled[name] += 1
+            if report and not response.prepared:
+                response.headers["X-Profile-File"] = os.path.basename(path)
+            return response
+        finally:
+            self._busy = False
+
+    async def _save(self, writer, name: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(None, writer, name)
+
+    def _write_pstats(self, name: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{name}.pstats")
+        self._stats[name].dump_stats(path)
+        return path
+
+    def _write_stacks(self, name: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{name}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self._stacks[name].most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+@web.middleware
+async def profiling_middleware(request, handler):
+    """Профилирование выбранных запросов; остальные проходят без накладных расходов"""
+    profiler = request.app["profiler"]
+    mode = None
+    requested_by_admin = False
+    if PROFILE_HEADER in request.headers:
+        if await admin_from_request(request) is not None:
+            requested = request.headers[PROFILE_HEADER]
+            mode = requested if requested in PROFILE_MODES else profiler.mode
+            requested_by_admin = True
+    elif profiler.sampled():
+        mode = profiler.mode
+    if mode is None:
+        return await handler(request)
+    return await profiler.profile(request, handler, mode, report=requested_by_admin)
+
+
+def setup_profiling(app):
+    app["profiler"] = Profiler()
+    app.middlewares.append(profiling_middleware)
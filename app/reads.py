@@ -0,0 +1,53 @@
+from sqlalchemy import select, bindparam, func, literal_column
+
+from app.images import image_urls
+from app.models import Advertisement, AdImage, User
+from app.schemas import AdvertisementResponseSchema, UserResponseSchema
+
+
+# Чтение для JSON-ответов идёт на уровне Core: объявление и владелец
+# приходят одной строкой JOIN, без объектов ORM, identity map и второго
+# запроса selectinload. Операторы собраны один раз при импорте, их
+# скомпилированный SQL берётся из кеша движка.
+ads = Advertisement.__table__
+users = User.__table__
+ad_images = AdImage.__table__
+
+# Имена файлов изображений одной строкой: коррелированный подзапрос идёт
+# по индексу (ad_id, id), поэтому порядок — порядок загрузки, а страница
+# списка получает изображения без отдельного запроса. Внешний id указан
+# с именем таблицы: в RETURNING SQLAlchemy пишет колонки без него, и
+# голый id достался бы ad_images.
+AD_IMAGE_NAMES = (
+    select(func.group_concat(ad_images.c.filename, ' '))
+    .where(ad_images.c.ad_id == literal_column('advertisements.id'))
+    .scalar_subquery()
+    .label('images')
+)
+
+AD_ROWS = select(
+    ads.c.id, ads.c.title, ads.c.description, ads.c.created_at, ads.c.owner_id,
+    users.c.username, users.c.email, users.c.created_at.label('owner_created_at'),
+    AD_IMAGE_NAMES,
+).select_from(ads.join(users, users.c.id == ads.c.owner_id))
+
+AD_BY_ID = AD_ROWS.where(ads.c.id == bindparam('ad_id'))
+
+AD_BY_IDS = AD_ROWS.where(ads.c.id.in_(bindparam('ids', expanding=True)))
+
+
+def ad_from_row(row, schema=AdvertisementResponseSchema, **extra):
+    """Схема ответа из строки AD_ROWS без повторной валидации.
+
+    Типы уже приведены драйвером и типами колонок, поэтому модели
+    собираются через model_construct. extra — дополнительные поля схемы
+    (например, подсветка в поиске).
+    """
+    return schema.model_construct(
+        id=row[0], title=row[1], description=row[2], created_at=row[3], owner_id=row[4],
+        owner_user=UserResponseSchema.model_construct(
+            id=row[4], username=row[5], email=row[6], created_at=row[7]
+        ),
+        images=image_urls(row[8]),
+        **extra
+    )
@@ -0,0 +1,122 @@
+import json
+import os
+from typing import List
+
+from aiohttp import web
+from pydantic import TypeAdapter, ValidationError
+
+from app.schemas import (
+    AdvertisementCreateSchema, AdvertisementUpdateSchema, UserCreateSchema, LoginSchema,
+    ProfilingSettingsSchema
+)
+
+
+# Лимиты тела запроса по маршрутам, байт. Проверяются до чтения тела
+# (по Content-Length) и по мере чтения (для chunked).
+MAX_AD_BODY = int(os.getenv("MAX_AD_BODY", str(16 * 1024)))
+MAX_AUTH_BODY = int(os.getenv("MAX_AUTH_BODY", str(4 * 1024)))
+MAX_BATCH_BODY = int(os.getenv("MAX_BATCH_BODY", str(8 * 1024 * 1024)))
+
+# Валидаторы собираются один раз. Служебные тела (вход, регистрация,
+# настройки) разбираются из байтов прямо в схему (validate_json). Текст
+# объявлений обычно на кириллице, а длинные строки не-ASCII парсер
+# pydantic-core 2.14 декодирует медленнее json.loads, поэтому объявления
+# и пакеты идут через json.loads + validate_python
+# (см. benchmarks/request_parsing.py).
+CREATE_AD = TypeAdapter(AdvertisementCreateSchema)
+UPDATE_AD = TypeAdapter(AdvertisementUpdateSchema)
+CREATE_ADS_BATCH = TypeAdapter(List[AdvertisementCreateSchema])
+REGISTER_USER = TypeAdapter(UserCreateSchema)
+LOGIN = TypeAdapter(LoginSchema)
+PROFILING_SETTINGS = TypeAdapter(ProfilingSettingsSchema)
+
+
+class InvalidBody(Exception):
+    """Тело запроса отклонено: 400 (не JSON или не проходит валидацию) или 413"""
+
+    def __init__(self, status: int, payload: dict):
+        super().__init__(payload["error"])
+        self.status = status
+        self.payload = payload
+
+    def response(self) -> web.Response:
+        response = web.json_response(self.payload, status=self.status)
+        if self.status == 413:
+            # Остаток большого тела не дочитываем — соединение закрывается
+            response.force_close()
+        return response
+
+
+def too_large(max_bytes: int) -> InvalidBody:
+    return InvalidBody(413, {"error": "Request body too large", "max_bytes": max_bytes})
+
+
+def validation_error(e: ValidationError) -> InvalidBody:
+    """Ошибка pydantic в едином формате ответа"""
+    errors = e.errors(include_context=False)
+    if any(error["type"] == "json_invalid" for error in errors):
+        return InvalidBody(400, {"error": "Invalid JSON"})
+    return InvalidBody(400, {"error": "Validation error", "details": validation_details(errors)})
+
+
+def validation_details(errors) -> list:
+    # input у ошибок разбора JSON — байты тела, в ответ их не возвращаем
+    return [
+        {key: value for key, value in error.items() if not isinstance(value, bytes)}
+        for error in errors
+    ]
+
+
+async def read_body(request, max_bytes: int) -> bytes:
+    """Тело запроса целиком, но не больше max_bytes"""
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise too_large(max_bytes)
+    chunks = []
+    size = 0
+    async for chunk in request.content.iter_any():
+        size += len(chunk)
+        if size > max_bytes:
+            raise too_large(max_bytes)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def load_json(body: bytes):
+    """json.loads с ошибкой в формате ответа"""
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise InvalidBody(400, {"error": "Invalid JSON"})
+
+
+async def parse_body(request, adapter: TypeAdapter, max_bytes: int = MAX_AD_BODY):
+    """Чтение и валидация JSON-тела за один проход pydantic-core"""
+    body = await read_body(request, max_bytes)
+    try:
+        return adapter.validate_json(body)
+    except ValidationError as e:
+        raise validation_error(e)
+
+
+async def parse_text_body(request, adapter: TypeAdapter, max_bytes: int = MAX_AD_BODY):
+    """Чтение и валидация тела с текстом объявления: json.loads + validate_python"""
+    data = load_json(await read_body(request, max_bytes))
+    try:
+        return adapter.validate_python(data)
+    except ValidationError as e:
+        raise validation_error(e)
+
+
+async def parse_batch_body(request, max_bytes: int = MAX_BATCH_BODY):
+    """Тело пакетного создания: (схемы, None) или (None, разобранный JSON).
+
+    Пакет — большое тело, обычно с кириллицей: json.loads, затем весь
+    массив проверяется одним вызовом validate_python. Если он не валиден,
+    возвращается уже разобранный JSON, чтобы обработчик проверил элементы
+    по одному и вернул ошибки с индексами.
+    """
+    data = load_json(await read_body(request, max_bytes))
+    try:
+        return CREATE_ADS_BATCH.validate_python(data), None
+    except ValidationError:
+        return None, data
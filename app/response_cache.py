@@ -0,0 +1,246 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import quote, urlencode
+
+from aiohttp import web
+
+from app.compression import negotiate, compressible, compress
+
+
+# Бюджет памяти под закешированные тела ответов и их время жизни
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+
+# Теги для точечной инвалидации
+ADS_LIST_TAG = "ads:list"
+# Страницы поиска: правка текста меняет состав выдачи, а не только
+# карточки, которые на странице уже есть
+ADS_SEARCH_TAG = "ads:search"
+
+
+def ad_tag(ad_id: int) -> str:
+    return f"ad:{ad_id}"
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "content_type", "tags", "expires_at", "variants")
+
+    def __init__(self, body: bytes, etag: str, content_type: str, tags, expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.content_type = content_type
+        self.tags = tags
+        self.expires_at = expires_at
+        # Сжатые варианты тела: {"gzip": bytes, "br": bytes}
+        self.variants = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(body) for body in self.variants.values())
+
+
+class ResponseCache:
+    """LRU-кеш сериализованных ответов с бюджетом памяти и инвалидацией по тегам"""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # Растёт при каждой инвалидации: ответ, собранный во время
+        # записи в БД, мог устареть и не должен попасть в кеш
+        self.generation = 0
+        # Общий счётчик инвалидаций воркеров (multiprocessing.Value):
+        # запись в соседнем процессе сбрасывает весь локальный кеш
+        self.shared = None
+        self._shared_seen = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+
+    def sync(self):
+        """Сброс кеша, если другой воркер что-то инвалидировал"""
+        if self.shared is not None and self.shared.value != self._shared_seen:
+            self._shared_seen = self.shared.value
+            self.clear()
+
+    def get(self, key):
+        self.sync()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self._remove(key)
+        self.misses += 1
+        return None
+
+    def put(self, key, body: bytes, content_type: str, tags=()) -> CachedResponse:
+        entry = CachedResponse(
+            body, make_etag(body), content_type, frozenset(tags),
+            time.monotonic() + self.ttl
+        )
+        if len(body) > self.max_bytes:
+            return entry
+        self._remove(key)
+        self._entries[key] = entry
+        self.size += len(body)
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        self._trim()
+        return entry
+
+    def add_variant(self, key, entry: CachedResponse, encoding: str, body: bytes):
+        """Сжатый вариант закешированного тела: сжимается один раз на запись"""
+        if self._entries.get(key) is not entry or encoding in entry.variants:
+            return
+        entry.variants[encoding] = body
+        self.size += len(body)
+        self._trim()
+
+    def _trim(self):
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, *tags):
+        self.generation += 1
+        if self.shared is not None:
+            with self.shared.get_lock():
+                self.sync()
+                self.shared.value += 1
+                self._shared_seen = self.shared.value
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                self._remove(key)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._tags.clear()
+        self.size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries), "bytes": self.size,
+            "hits": self.hits, "misses": self.misses,
+        }
+
+
+def make_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому тела"""
+    return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def cache_response(handler):
+    """Декоратор: GET-обработчик участвует в кешировании ответов.
+
+    Обработчик может указать теги инвалидации через response['cache_tags'].
+    Ответ не должен зависеть от пользователя — ключом служит только URL.
+    """
+    handler.cache_response = True
+    return handler
+
+
+def cache_key(request) -> str:
+    """Ключ кеша: путь и отсортированные параметры запроса.
+
+    Декодированные имена и значения кодируются заново: закодированные
+    в них & и = не должны совпасть с настоящими параметрами, иначе один
+    запрос отравил бы кеш для другого.
+    """
+    query = sorted(request.query.items())
+    return quote(request.path) + ("?" + urlencode(query) if query else "")
+
+
+def _not_modified(request, *etags) -> bool:
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return False
+    return any(tag.value == "*" or f'"{tag.value}"' in etags for tag in if_none_match)
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """ETag сжатого варианта отличается от ETag исходного тела"""
+    return f'{etag[:-1]}-{encoding}"'
+
+
+async def _cached_reply(request, cache: ResponseCache, key, entry: CachedResponse):
+    body, etag, encoding = entry.body, entry.etag, None
+    compress_body = request.app.get("compression") and compressible(entry.content_type, len(body))
+    if compress_body:
+        encoding = negotiate(request)
+    if encoding is not None:
+        etag = variant_etag(entry.etag, encoding)
+    headers = {"ETag": etag}
+    if compress_body:
+        headers["Vary"] = "Accept-Encoding"
+    if _not_modified(request, etag, entry.etag):
+        return web.Response(status=304, headers=headers)
+    if encoding is not None:
+        body = entry.variants.get(encoding)
+        if body is None:
+            body = await compress(entry.body, encoding)
+            cache.add_variant(key, entry, encoding, body)
+        headers["Content-Encoding"] = encoding
+    headers["Content-Type"] = entry.content_type
+    return web.Response(body=body, headers=headers)
+
+
+@web.middleware
+async def response_cache_middleware(request, handler):
+    """Read-through кеш для GET-маршрутов, помеченных @cache_response"""
+    cache = request.app.get("response_cache")
+    if (cache is None or request.method not in ("GET", "HEAD")
+            or not getattr(request.match_info.handler, "cache_response", False)):
+        return await handler(request)
+
+    key = cache_key(request)
+    entry = cache.get(key)
+    if entry is None:
+        generation = cache.generation
+        response = await handler(request)
+        if response.status != 200 or not isinstance(response.body, bytes):
+            return response
+        tags = response.get("cache_tags", ())
+        content_type = response.headers.get("Content-Type", "application/octet-stream")
+        cache.sync()
+        if cache.generation == generation:
+            entry = cache.put(key, response.body, content_type, tags)
+        else:
+            entry = CachedResponse(response.body, make_etag(response.body), content_type, tags, 0)
+    return await _cached_reply(request, cache, key, entry)
+
+
+def invalidate_responses(app, *tags):
+    """Сброс закешированных ответов с указанными тегами"""
+    cache = app.get("response_cache")
+    if cache is not None:
+        cache.invalidate(*tags)
+
+
+def share_invalidations(app, counter):
+    """Подключение кеша к общему счётчику инвалидаций при нескольких воркерах"""
+    cache = app.get("response_cache")
+    if cache is not None:
+        cache.shared = counter
+        cache._shared_seen = counter.value
+
+
+def setup_response_cache(app, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+    app["response_cache"] = ResponseCache(max_bytes=max_bytes)
+    app.middlewares.append(response_cache_middleware)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr, field_validator
-from typing import Optional, List
+from typing import Optional, List, Any, Dict
 from datetime import datetime
 
 
@@ -16,13 +16,6 @@ class UserResponseSchema(BaseModel):
     created_at: datetime
 
     model_config = {"from_attributes": True}
-    
-    def model_dump(self, **kwargs):
-        data = super().model_dump(**kwargs)
-        # Преобразуем datetime в строку для JSON
-        if isinstance(data['created_at'], datetime):
-            data['created_at'] = data['created_at'].isoformat()
-        return data
 
 
 class AdvertisementCreateSchema(BaseModel):
@@ -70,31 +63,63 @@ class AdvertisementResponseSchema(BaseModel):
     description: str
     created_at: datetime
     owner_id: int
-    owner_user: UserResponseSchema
+    # В JSON-ответе связь называется owner
+    owner_user: UserResponseSchema = Field(..., serialization_alias="owner")
+    # URL изображений в порядке загрузки
+    images: List[str] = []
 
     model_config = {"from_attributes": True}
-    
-    def model_dump(self, **kwargs):
-        data = super().model_dump(**kwargs)
-        # Преобразуем datetime в строку для JSON
-        if isinstance(data['created_at'], datetime):
-            data['created_at'] = data['created_at'].isoformat()
-        # Переименовываем owner_user в owner для API
-        if 'owner_user' in data:
-            data['owner'] = data.pop('owner_user')
-        # Преобразуем datetime в owner если он есть
-        if 'owner' in data and isinstance(data['owner'], dict) and 'created_at' in data['owner']:
-            if isinstance(data['owner']['created_at'], datetime):
-                data['owner']['created_at'] = data['owner']['created_at'].isoformat()
-        return data
 
 
 class AdvertisementListResponseSchema(BaseModel):
     items: List[AdvertisementResponseSchema]
-    total: int
-    page: int
+    total: Optional[int] = None  # None при ?count=none
+    page: Optional[int] = None  # None в режиме курсора
     per_page: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
+class AdvertisementSearchItemSchema(AdvertisementResponseSchema):
+    # HTML-фрагменты: текст объявления экранирован, совпадения в <mark>
+    title_highlight: str
+    snippet: str
+    score: float
+
+
+class AdvertisementSearchResponseSchema(BaseModel):
+    items: List[AdvertisementSearchItemSchema]
+    per_page: int
+    next_cursor: Optional[str] = None
+
+
+class AdChangeSchema(BaseModel):
+    seq: int
+    op: str  # upsert | delete
+    id: int
+    ad: Optional[AdvertisementResponseSchema] = None  # только для upsert
+
+
+class AdChangesResponseSchema(BaseModel):
+    changes: List[AdChangeSchema]
+    next_token: str
+    has_more: bool
+
+
+class AdvertisementBatchResponseSchema(BaseModel):
+    items: List[AdvertisementResponseSchema]
+    missing: List[int]
+
+
+class AdvertisementBatchCreateResponseSchema(BaseModel):
+    created: List[AdvertisementResponseSchema]
+    errors: List[Dict[str, Any]]
+
+
+class AdvertisementBatchDeleteResponseSchema(BaseModel):
+    deleted: List[int]
+    not_found: List[int]
+    forbidden: List[int]
 
 
 class LoginSchema(BaseModel):
@@ -105,3 +130,8 @@ class LoginSchema(BaseModel):
 class TokenResponseSchema(BaseModel):
     access_token: str
     token_type: str = "bearer"
+
+
+class ProfilingSettingsSchema(BaseModel):
+    rate: Optional[float] = Field(None, ge=0, le=1)
+    mode: Optional[str] = Field(None, pattern="^(cprofile|sampler)$")
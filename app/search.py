@@ -0,0 +1,82 @@
+import html
+import re
+
+from sqlalchemy import text, bindparam
+
+
+# Разметка совпадений в заголовке и фрагменте описания. FTS5 ставит
+# вокруг совпадений управляющие символы, а не теги: текст объявления
+# сначала экранируется, и только потом они заменяются на <mark>
+HIGHLIGHT_OPEN = '<mark>'
+HIGHLIGHT_CLOSE = '</mark>'
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+SNIPPET_TOKENS = 16
+MAX_QUERY_TERMS = 16
+
+# bm25: совпадение в заголовке весит больше, чем в описании
+RANKED_IDS = text("""
+    SELECT rowid AS id, bm25(ads_fts, 10.0, 1.0) AS score
+    FROM ads_fts
+    WHERE ads_fts MATCH :match
+      AND (:after_score IS NULL
+           OR bm25(ads_fts, 10.0, 1.0) > :after_score
+           OR (bm25(ads_fts, 10.0, 1.0) = :after_score AND rowid < :after_id))
+    ORDER BY score, id DESC
+    LIMIT :limit
+""")
+
+# Подсветка считается только для строк текущей страницы
+HIGHLIGHTS = text("""
+    SELECT rowid AS id,
+           highlight(ads_fts, 0, :open, :close) AS title_highlight,
+           snippet(ads_fts, 1, :open, :close, '…', :tokens) AS snippet
+    FROM ads_fts
+    WHERE ads_fts MATCH :match AND rowid IN :ids
+""").bindparams(bindparam('ids', expanding=True))
+
+
+def render_highlight(marked: str) -> str:
+    """HTML-фрагмент из текста с маркерами FTS5: текст экранирован, совпадения в <mark>"""
+    return (
+        html.escape(marked or '')
+        .replace(MATCH_START, HIGHLIGHT_OPEN)
+        .replace(MATCH_END, HIGHLIGHT_CLOSE)
+    )
+
+
+def build_match_query(query: str) -> str:
+    """Пользовательская строка -> выражение FTS5 MATCH.
+
+    Каждое слово берётся в кавычки (операторы FTS5 в запросе не работают),
+    слова объединяются через AND, последнее ищется по префиксу.
+    """
+    terms = re.findall(r'\w+', query)[:MAX_QUERY_TERMS]
+    if not terms:
+        raise ValueError(query)
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+async def find_ads(session, query: str, limit: int, position=None):
+    """Ранжированный поиск: [(id, score, title_highlight, snippet), ...]"""
+    match = build_match_query(query)
+    after_score, after_id = position if position is not None else (None, None)
+    result = await session.execute(RANKED_IDS, {
+        'match': match, 'after_score': after_score, 'after_id': after_id, 'limit': limit
+    })
+    ranked = result.all()
+    if not ranked:
+        return []
+    result = await session.execute(HIGHLIGHTS, {
+        'match': match, 'ids': [row.id for row in ranked],
+        'open': MATCH_START, 'close': MATCH_END, 'tokens': SNIPPET_TOKENS
+    })
+    highlights = {row.id: row for row in result}
+    return [
+        (
+            row.id, row.score,
+            render_highlight(highlights[row.id].title_highlight),
+            render_highlight(highlights[row.id].snippet),
+        )
+        for row in ranked
+    ]
@@ -0,0 +1,19 @@
+from aiohttp import web
+
+
+def dump_json(model) -> bytes:
+    """Сериализация схемы ответа сразу в JSON-байты.
+
+    Скомпилированный сериализатор pydantic-core за один проход применяет
+    алиасы (owner_user -> owner) и переводит datetime в ISO 8601 — без
+    промежуточного dict и повторного кодирования через json.
+    """
+    return model.__pydantic_serializer__.to_json(model, by_alias=True)
+
+
+def model_response(model, status: int = 200) -> web.Response:
+    """JSON-ответ из схемы pydantic"""
+    return web.Response(
+        body=dump_json(model), status=status,
+        content_type='application/json', charset='utf-8'
+    )
@@ -1,43 +1,197 @@
 from aiohttp import web
 from sqlalchemy.future import select
-from sqlalchemy import update, delete, func
-from app.database import async_session
-from app.models import Advertisement, User
+from sqlalchemy import update, delete, insert, func, literal, String
+from app.database import read_session
+from app.writer import run_write, write_queue
+from app.models import Advertisement, AdImage, User
 from app.schemas import (
-    AdvertisementCreateSchema, AdvertisementUpdateSchema, 
     AdvertisementResponseSchema, AdvertisementListResponseSchema,
-    UserCreateSchema, UserResponseSchema, LoginSchema, TokenResponseSchema
+    AdvertisementBatchResponseSchema, AdvertisementBatchCreateResponseSchema,
+    AdvertisementBatchDeleteResponseSchema,
+    AdvertisementSearchItemSchema, AdvertisementSearchResponseSchema,
+    AdChangeSchema, AdChangesResponseSchema,
+    UserResponseSchema, TokenResponseSchema
+)
+from app.auth import (
+    require_auth, require_admin, register_user, authenticate_user, create_access_token,
+    auth_cache_stats
 )
-from app.auth import require_auth, register_user, authenticate_user, create_access_token
 from pydantic import ValidationError
+from datetime import datetime
+import asyncio
+import logging
 import math
-from sqlalchemy.orm import selectinload
+import os
+from app.serialization import model_response, dump_json
+from app.counters import change_ad_count, change_ad_counts, get_ad_count
+from app.response_cache import (
+    cache_response, invalidate_responses, ad_tag, ADS_LIST_TAG, ADS_SEARCH_TAG
+)
+from app.pagination import (
+    encode_cursor, decode_cursor, InvalidCursor, stored_datetime,
+    encode_search_cursor, decode_search_cursor, ads_filters, ads_page_query,
+    encode_change_token, decode_change_token
+)
+from app.changes import (
+    CHANGE_STATE, CHANGES_BATCH, CHANGES_MAX_BATCH, changed_ads_query, tombstones_query
+)
+from app.search import find_ads
+from app.reads import ads, AD_ROWS, AD_BY_ID, AD_BY_IDS, AD_IMAGE_NAMES, ad_from_row
+from app.metrics import metrics as process_metrics
+from app.admission import admission_metrics
+from app.request_body import (
+    InvalidBody, parse_body, parse_text_body, parse_batch_body, CREATE_AD, UPDATE_AD, REGISTER_USER, LOGIN,
+    PROFILING_SETTINGS, MAX_AUTH_BODY
+)
+from app.broadcast import publish_ad_event, sse_stream, ws_stream, STREAM_MAX_SUBSCRIBERS
+from app.images import (
+    MAX_IMAGES_PER_AD, receive_images, publish_images, too_many_images, image_path,
+    image_headers, image_urls
+)
+
+logger = logging.getLogger(__name__)
+
+# Режимы подсчёта total для списка объявлений
+COUNT_MODES = ('exact', 'estimated', 'none')
+
+# Ограничения пакетных операций
+MAX_BATCH_IDS = 100
+MAX_BATCH_CREATE = 1000
+
+# Размер порции строк при потоковой выгрузке
+EXPORT_BATCH_SIZE = 500
+
+
+def owned_by(user):
+    """Изменять и удалять объявление может только его владелец.
+
+    Условие WHERE: права проверяются тем же запросом, что и запись.
+    """
+    return Advertisement.owner_id == user.id
+
+
+# Колонки объявления для RETURNING и ответов без повторного SELECT
+AD_COLUMNS = (
+    Advertisement.id, Advertisement.title, Advertisement.description,
+    Advertisement.created_at, Advertisement.owner_id
+)
+
+
+async def raise_missing_or_forbidden(session, ad_id: int):
+    """Запись по id и владельцу не затронула строк: объявления нет (404) или оно чужое (403)"""
+    result = await session.execute(select(Advertisement.id).where(Advertisement.id == ad_id))
+    if result.scalar() is None:
+        raise web.HTTPNotFound(reason="Advertisement not found")
+    raise web.HTTPForbidden(reason="Access denied")
+
+
+def ad_response(row, owner) -> AdvertisementResponseSchema:
+    """Ответ из строки RETURNING и уже известного владельца"""
+    data = dict(row._mapping)
+    if 'images' in data:
+        data['images'] = image_urls(data['images'])
+    return AdvertisementResponseSchema(
+        **data, owner_user=UserResponseSchema.model_validate(owner)
+    )
+
+
+def parse_ids(value: str):
+    """Разбор списка id вида "1,2,3" без повторов, с сохранением порядка"""
+    ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    if not ids or len(ids) > MAX_BATCH_IDS or min(ids) < 1:
+        raise ValueError(value)
+    return ids
 
 
 async def register(request):
     """Регистрация нового пользователя"""
     try:
-        data = await request.json()
-        user_data = UserCreateSchema(**data)
+        user_data = await parse_body(request, REGISTER_USER, MAX_AUTH_BODY)
         user = await register_user(user_data)
         
-        return web.json_response(
-            UserResponseSchema.model_validate(user).model_dump(),
-            status=201
-        )
-    except ValidationError as e:
-        return web.json_response({"error": "Validation error", "details": e.errors()}, status=400)
+        return model_response(UserResponseSchema.model_validate(user), status=201)
+    except InvalidBody as e:
+        return e.response()
     except web.HTTPConflict as e:
         return web.json_response({"error": str(e.reason)}, status=409)
+    except web.HTTPServiceUnavailable as e:
+        return web.json_response({"error": str(e.reason)}, status=503,
+                                 headers={"Retry-After": e.headers.get("Retry-After", "1")})
     except Exception as e:
         return web.json_response({"error": "Internal server error"}, status=500)
 
 
+def _cache_metrics(caches: dict):
+    """Размер и попадания кешей в виде метрик с меткой cache"""
+    return [
+        ("app_cache_entries", "gauge", "Cached entries",
+         {(("cache", name),): stats["size"] for name, stats in caches.items()}),
+        ("app_cache_hits_total", "counter", "Cache hits",
+         {(("cache", name),): stats["hits"] for name, stats in caches.items()}),
+        ("app_cache_misses_total", "counter", "Cache misses",
+         {(("cache", name),): stats["misses"] for name, stats in caches.items()}),
+    ]
+
+
+async def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus"""
+    caches = dict(auth_cache_stats())
+    response_cache = request.app.get("response_cache")
+    extra = [
+        ("app_response_cache_bytes", "gauge", "Response cache body bytes",
+         response_cache.size if response_cache is not None else 0),
+        ("app_write_queue_depth", "gauge", "Pending write jobs", write_queue.depth()),
+        ("app_write_batches_total", "counter", "Committed write batches", write_queue.batches),
+        ("app_write_jobs_total", "counter", "Write jobs executed", write_queue.jobs),
+    ]
+    if response_cache is not None:
+        stats = response_cache.stats()
+        caches["responses"] = {"size": stats["entries"], "hits": stats["hits"], "misses": stats["misses"]}
+    if "inflight" in request.app:
+        extra.append(("http_requests_in_flight", "gauge", "Requests being handled",
+                      request.app["inflight"].count))
+    extra.extend(admission_metrics(request.app))
+    broadcaster = request.app.get("broadcaster")
+    if broadcaster is not None:
+        extra += [
+            ("app_stream_subscribers", "gauge", "Live feed subscribers", broadcaster.subscribers),
+            ("app_stream_events_total", "counter", "Live feed events published", broadcaster.published),
+            ("app_stream_evicted_total", "counter", "Slow live feed subscribers evicted",
+             broadcaster.evicted),
+        ]
+    return web.Response(
+        body=process_metrics.render(_cache_metrics(caches) + extra).encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+@require_admin
+async def get_profiling(request):
+    """Текущие настройки профилирования и число собранных профилей"""
+    return web.json_response(request.app["profiler"].state())
+
+
+@require_admin
+async def update_profiling(request):
+    """Включение/выключение профилирования без перезапуска: {"rate": 0.01, "mode": "sampler"}"""
+    try:
+        settings = await parse_body(request, PROFILING_SETTINGS, MAX_AUTH_BODY)
+    except InvalidBody as e:
+        return e.response()
+    profiler = request.app["profiler"]
+    if settings.rate is not None:
+        profiler.rate = settings.rate
+    if settings.mode is not None:
+        profiler.mode = settings.mode
+    logger.info("Profiling settings changed by %s: mode=%s rate=%s",
+                request['user'].username, profiler.mode, profiler.rate)
+    return web.json_response(profiler.state())
+
+
 async def login(request):
     """Аутентификация пользователя"""
     try:
-        data = await request.json()
-        login_data = LoginSchema(**data)
+        login_data = await parse_body(request, LOGIN, MAX_AUTH_BODY)
         user = await authenticate_user(login_data)
         
         access_token = create_access_token(data={"sub": user.username})
@@ -46,10 +200,13 @@ async def login(request):
             TokenResponseSchema(access_token=access_token).model_dump(),
             status=200
         )
-    except ValidationError as e:
-        return web.json_response({"error": "Validation error", "details": e.errors()}, status=400)
+    except InvalidBody as e:
+        return e.response()
     except web.HTTPUnauthorized as e:
         return web.json_response({"error": str(e.reason)}, status=401)
+    except web.HTTPServiceUnavailable as e:
+        return web.json_response({"error": str(e.reason)}, status=503,
+                                 headers={"Retry-After": e.headers.get("Retry-After", "1")})
     except Exception as e:
         return web.json_response({"error": "Internal server error"}, status=500)
 
@@ -58,108 +215,550 @@ async def login(request):
 async def create_ad(request):
     """Создание нового объявления"""
     try:
-        data = await request.json()
-        ad_data = AdvertisementCreateSchema(**data)
-        
-        # Проверяем существование пользователя
-        async with async_session() as session:
-            result = await session.execute(select(User).where(User.id == ad_data.owner_id))
-            user = result.scalar()
-            if not user:
-                return web.json_response({"error": "User not found"}, status=404)
-            
-            ad = Advertisement(
-                title=ad_data.title,
-                description=ad_data.description,
-                owner_id=ad_data.owner_id
-            )
-            session.add(ad)
-            await session.commit()
-            await session.refresh(ad)
+        ad_data = await parse_text_body(request, CREATE_AD)
+        current_user = request['user']
+        
+        async def insert_ad(session):
+            # Владелец — обычно сам автор запроса, он уже загружен require_auth
+            owner = current_user
+            if ad_data.owner_id != current_user.id:
+                owner = await session.get(User, ad_data.owner_id)
+                if owner is None:
+                    raise web.HTTPNotFound(reason="User not found")
             
-            # Получаем объявление с загруженным пользователем
             result = await session.execute(
-                select(Advertisement)
-                .options(selectinload(Advertisement.owner_user))
-                .where(Advertisement.id == ad.id)
+                insert(Advertisement).values(**ad_data.model_dump()).returning(*AD_COLUMNS)
             )
-            ad_with_owner = result.scalar()
-            
-            return web.json_response(
-                AdvertisementResponseSchema.model_validate(ad_with_owner).model_dump(),
-                status=201
-            )
-    except ValidationError as e:
-        return web.json_response({"error": "Validation error", "details": e.errors()}, status=400)
+            row = result.one()
+            await change_ad_count(session, owner.id, 1)
+            return ad_response(row, owner)
+        
+        def after_commit(ad):
+            invalidate_responses(request.app, ADS_LIST_TAG)
+            publish_ad_event(request.app, "created", ad)
+        
+        ad = await run_write(insert_ad, after_commit)
+        return model_response(ad, status=201)
+    except InvalidBody as e:
+        return e.response()
+    except web.HTTPNotFound as e:
+        return web.json_response({"error": str(e.reason)}, status=404)
     except Exception as e:
         return web.json_response({"error": "Internal server error"}, status=500)
 
 
-async def get_ads(request):
-    """Получение списка объявлений с пагинацией"""
+def parse_datetime(value: str) -> datetime:
+    """Разбор ISO 8601 из query-параметра"""
+    return datetime.fromisoformat(value)
+
+
+async def list_ads(request, owner_id: int = None, owner_must_exist: bool = False):
+    """Общая часть списков объявлений: пагинация, фильтры и подсчёт total.
+
+    Фильтры ``?created_after=`` и ``?created_before=`` (ISO 8601, границы
+    не включаются) и владелец ``owner_id`` сужают ленту, не меняя её порядка,
+    и обслуживаются индексами (created_at, id) и (owner_id, created_at, id).
+    С ``owner_must_exist`` пустая выдача несуществующего владельца даёт 404.
+    """
+    try:
+        created_after = created_before = None
+        if 'created_after' in request.query:
+            created_after = parse_datetime(request.query['created_after'])
+        if 'created_before' in request.query:
+            created_before = parse_datetime(request.query['created_before'])
+    except ValueError:
+        return web.json_response({"error": "Invalid filters"}, status=400)
+    conditions = ads_filters(owner_id, created_after, created_before)
     try:
+        cursor = request.query.get('cursor')
+        count_mode = request.query.get('count', 'estimated')
+        if count_mode not in COUNT_MODES:
+            return web.json_response({"error": "Invalid count mode"}, status=400)
         page = int(request.query.get('page', 1))
         per_page = min(int(request.query.get('per_page', 10)), 100)  # Максимум 100 на страницу
         
         if page < 1 or per_page < 1:
             return web.json_response({"error": "Invalid pagination parameters"}, status=400)
         
-        async with async_session() as session:
-            # Подсчитываем общее количество объявлений
-            total_result = await session.execute(select(func.count(Advertisement.id)))
-            total = total_result.scalar()
+        position = None
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except InvalidCursor:
+                return web.json_response({"error": "Invalid cursor"}, status=400)
+        
+        async with read_session() as session:
+            # Подсчитываем общее количество объявлений. Счётчик есть только
+            # для всей ленты и для владельца; интервал дат считается COUNT(*)
+            # по диапазону индекса.
+            total = pages = None
+            if count_mode == 'estimated' and created_after is None and created_before is None:
+                total = await get_ad_count(session, owner_id)
+            elif count_mode != 'none':
+                total_result = await session.execute(
+                    select(func.count(Advertisement.id)).where(*conditions)
+                )
+                total = total_result.scalar()
             
             # Вычисляем количество страниц
-            pages = math.ceil(total / per_page)
+            if total is not None:
+                pages = math.ceil(total / per_page)
             
-            # Получаем объявления с пагинацией
-            offset = (page - 1) * per_page
-            result = await session.execute(
-                select(Advertisement)
-                .options(selectinload(Advertisement.owner_user))
-                .order_by(Advertisement.created_at.desc())
-                .offset(offset)
-                .limit(per_page)
+            query = ads_page_query(
+                per_page, conditions, position,
+                offset=(page - 1) * per_page if cursor is None else 0
             )
-            ads = result.scalars().all()
+            result = await session.execute(query)
+            rows = result.all()
+            # Непустая страница уже доказывает, что владелец существует
+            if not rows and owner_must_exist and await session.get(User, owner_id) is None:
+                return web.json_response({"error": "User not found"}, status=404)
+            
+            next_cursor = None
+            if len(rows) > per_page:
+                rows = rows[:per_page]
+                next_cursor = encode_cursor(rows[-1][-1], rows[-1][0])
             
             # Преобразуем в схемы ответа
-            ads_data = [AdvertisementResponseSchema.model_validate(ad).model_dump() for ad in ads]
+            ads_data = [ad_from_row(row) for row in rows]
             
-            return web.json_response(
+            response = model_response(
                 AdvertisementListResponseSchema(
                     items=ads_data,
                     total=total,
-                    page=page,
+                    page=page if cursor is None else None,
                     per_page=per_page,
-                    pages=pages
-                ).model_dump()
+                    pages=pages,
+                    next_cursor=next_cursor
+                )
             )
+            # Страница списка сбрасывается при изменении любого её объявления
+            response['cache_tags'] = {ADS_LIST_TAG, *(ad_tag(ad.id) for ad in ads_data)}
+            return response
     except ValueError as e:
         return web.json_response({"error": "Invalid pagination parameters"}, status=400)
     except Exception as e:
         return web.json_response({"error": "Internal server error"}, status=500)
 
 
+@cache_response
+async def get_ads(request):
+    """Получение списка объявлений с пагинацией.
+
+    Два режима:
+    - ``?page=&per_page=`` — классическая постраничная выдача через OFFSET;
+    - ``?cursor=&per_page=`` — keyset-пагинация по индексу (created_at, id),
+      стоимость любой страницы равна стоимости первой. Пустой ``cursor``
+      означает начало ленты, следующую страницу даёт ``next_cursor``.
+
+    ``?count=`` управляет полями total/pages: ``estimated`` (по умолчанию) —
+    из поддерживаемого счётчика, ``exact`` — COUNT(*) по таблице,
+    ``none`` — без подсчёта.
+
+    Фильтры: ``?owner_id=``, ``?created_after=``, ``?created_before=``.
+    """
+    if 'ids' in request.query:
+        return await get_ads_by_ids(request)
+    owner_id = None
+    if 'owner_id' in request.query:
+        try:
+            owner_id = int(request.query['owner_id'])
+        except ValueError:
+            return web.json_response({"error": "Invalid filters"}, status=400)
+    return await list_ads(request, owner_id)
+
+
+@cache_response
+async def get_user_ads(request):
+    """Объявления пользователя: та же лента, что и /ads, с owner_id из пути"""
+    owner_id = int(request.match_info['user_id'])
+    return await list_ads(request, owner_id, owner_must_exist=True)
+
+
+@cache_response
+async def search_ads(request):
+    """Полнотекстовый поиск по заголовку и описанию (FTS5, ранжирование bm25).
+
+    ``?q=`` — строка поиска, ``?per_page=`` и ``?cursor=`` — как у списка
+    объявлений: следующую страницу даёт ``next_cursor``.
+    """
+    query = request.query.get('q', '').strip()
+    if not query:
+        return web.json_response({"error": "Missing search query"}, status=400)
+    try:
+        per_page = min(int(request.query.get('per_page', 10)), 100)  # Максимум 100 на страницу
+        if per_page < 1:
+            raise ValueError(per_page)
+        cursor = request.query.get('cursor')
+        position = decode_search_cursor(cursor) if cursor else None
+    except InvalidCursor:
+        return web.json_response({"error": "Invalid cursor"}, status=400)
+    except ValueError:
+        return web.json_response({"error": "Invalid pagination parameters"}, status=400)
+    
+    try:
+        async with read_session() as session:
+            try:
+                matches = await find_ads(session, query, per_page + 1, position)
+            except ValueError:
+                return web.json_response({"error": "Invalid search query"}, status=400)
+            
+            next_cursor = None
+            if len(matches) > per_page:
+                matches = matches[:per_page]
+                next_cursor = encode_search_cursor(matches[-1][1], matches[-1][0])
+            
+            result = await session.execute(AD_BY_IDS, {'ids': [ad_id for ad_id, *_ in matches]})
+            rows = {row[0]: row for row in result}
+            
+            items = [
+                ad_from_row(
+                    rows[ad_id], AdvertisementSearchItemSchema,
+                    title_highlight=title_highlight, snippet=snippet, score=score
+                )
+                for ad_id, score, title_highlight, snippet in matches if ad_id in rows
+            ]
+            response = model_response(AdvertisementSearchResponseSchema(
+                items=items, per_page=per_page, next_cursor=next_cursor
+            ))
+            response['cache_tags'] = {
+                ADS_LIST_TAG, ADS_SEARCH_TAG, *(ad_tag(item.id) for item in items)
+            }
+            return response
+    except Exception as e:
+        return web.json_response({"error": "Internal server error"}, status=500)
+
+
+async def get_ads_by_ids(request):
+    """Получение нескольких объявлений по ?ids=1,2,3 одним запросом"""
+    try:
+        ids = parse_ids(request.query['ids'])
+    except ValueError:
+        return web.json_response(
+            {"error": f"ids must be 1 to {MAX_BATCH_IDS} positive integers"}, status=400
+        )
+    try:
+        async with read_session() as session:
+            result = await session.execute(AD_BY_IDS, {'ids': ids})
+            found = {row[0]: row for row in result}
+            
+            response = model_response(AdvertisementBatchResponseSchema(
+                items=[ad_from_row(found[ad_id]) for ad_id in ids if ad_id in found],
+                missing=[ad_id for ad_id in ids if ad_id not in found]
+            ))
+            response['cache_tags'] = {ADS_LIST_TAG, *(ad_tag(ad_id) for ad_id in ids)}
+            return response
+    except Exception as e:
+        return web.json_response({"error": "Internal server error"}, status=500)
+
+
+@require_auth
+async def create_ads_batch(request):
+    """Пакетное создание объявлений в одной транзакции.
+
+    Тело — JSON-массив объектов AdvertisementCreateSchema. Некорректные
+    элементы не прерывают пакет, а попадают в errors с индексом.
+    """
+    try:
+        ads_data, data = await parse_batch_body(request)
+        items = ads_data if ads_data is not None else data
+        if not isinstance(items, list) or not items:
+            return web.json_response({"error": "Expected a non-empty JSON array"}, status=400)
+        if len(items) > MAX_BATCH_CREATE:
+            return web.json_response(
+                {"error": f"At most {MAX_BATCH_CREATE} items per batch"}, status=400
+            )
+        
+        errors = []
+        valid = []
+        if ads_data is not None:
+            valid = list(enumerate(ads_data))
+        else:
+            # В пакете есть некорректные элементы: проверяем по одному
+            for index, item in enumerate(data):
+                if not isinstance(item, dict):
+                    errors.append({"index": index, "error": "Item must be an object"})
+                    continue
+                try:
+                    valid.append((index, CREATE_AD.validate_python(item)))
+                except ValidationError as e:
+                    errors.append({"index": index, "error": "Validation error",
+                                   "details": e.errors(include_context=False)})
+        
+        created = []
+        current_user = request['user']
+        
+        async def insert_ads(session):
+            # Проверяем существование остальных владельцев одним запросом
+            owners = {current_user.id: current_user}
+            owner_ids = {ad_data.owner_id for _, ad_data in valid} - owners.keys()
+            if owner_ids:
+                result = await session.execute(select(User).where(User.id.in_(owner_ids)))
+                owners.update((user.id, user) for user in result.scalars())
+            
+            rows = []
+            for index, ad_data in valid:
+                if ad_data.owner_id not in owners:
+                    errors.append({"index": index, "error": "User not found"})
+                    continue
+                rows.append(ad_data.model_dump())
+            
+            if rows:
+                result = await session.execute(
+                    insert(Advertisement).returning(
+                        Advertisement.id, Advertisement.created_at,
+                        sort_by_parameter_order=True
+                    ),
+                    rows
+                )
+                per_owner = {}
+                for row, (ad_id, created_at) in zip(rows, result.all()):
+                    per_owner[row['owner_id']] = per_owner.get(row['owner_id'], 0) + 1
+                    created.append(AdvertisementResponseSchema(
+                        id=ad_id, created_at=created_at,
+                        owner_user=UserResponseSchema.model_validate(owners[row['owner_id']]),
+                        **row
+                    ))
+                await change_ad_counts(session, per_owner)
+        
+        def after_commit(_):
+            if created:
+                invalidate_responses(request.app, ADS_LIST_TAG)
+                for ad in created:
+                    publish_ad_event(request.app, "created", ad)
+        
+        await run_write(insert_ads, after_commit)
+        
+        errors.sort(key=lambda error: error["index"])
+        return model_response(
+            AdvertisementBatchCreateResponseSchema(created=created, errors=errors),
+            status=201 if created else 400
+        )
+    except InvalidBody as e:
+        return e.response()
+    except Exception as e:
+        return web.json_response({"error": "Internal server error"}, status=500)
+
+
+@require_auth
+async def delete_ads_batch(request):
+    """Пакетное удаление объявлений по ?ids=1,2,3 в одной транзакции"""
+    try:
+        ids = parse_ids(request.query.get('ids', ''))
+    except ValueError:
+        return web.json_response(
+            {"error": f"ids must be 1 to {MAX_BATCH_IDS} positive integers"}, status=400
+        )
+    try:
+        current_user = request['user']
+        
+        async def delete_ads(session):
+            # Удаляются только свои объявления (права проверяются в WHERE)
+            result = await session.execute(
+                delete(Advertisement)
+                .where(Advertisement.id.in_(ids), owned_by(current_user))
+                .returning(Advertisement.id)
+                .execution_options(synchronize_session=False)
+            )
+            removed = set(result.scalars())
+            
+            # Оставшиеся id — чужие или несуществующие
+            rest = [ad_id for ad_id in ids if ad_id not in removed]
+            existing = set()
+            if rest:
+                result = await session.execute(
+                    select(Advertisement.id).where(Advertisement.id.in_(rest))
+                )
+                existing = set(result.scalars())
+            
+            deleted = [ad_id for ad_id in ids if ad_id in removed]
+            forbidden = [ad_id for ad_id in rest if ad_id in existing]
+            not_found = [ad_id for ad_id in rest if ad_id not in existing]
+            if deleted:
+                await change_ad_count(session, current_user.id, -len(deleted))
+            return deleted, not_found, forbidden
+        
+        def after_commit(outcome):
+            deleted = outcome[0]
+            if deleted:
+                invalidate_responses(
+                    request.app, ADS_LIST_TAG, *(ad_tag(ad_id) for ad_id in deleted)
+                )
+                for ad_id in deleted:
+                    publish_ad_event(request.app, "deleted", {"id": ad_id})
+        
+        deleted, not_found, forbidden = await run_write(delete_ads, after_commit)
+        
+        return model_response(AdvertisementBatchDeleteResponseSchema(
+            deleted=deleted, not_found=not_found, forbidden=forbidden
+        ))
+    except Exception as e:
+        return web.json_response({"error": "Internal server error"}, status=500)
+
+
+async def _read_export(query, chunks: asyncio.Queue, stop: asyncio.Event):
+    """Чтение выгрузки серверным курсором в ограниченную очередь.
+
+    Работает отдельной задачей, чтобы отключение клиента не прерывало
+    обращение к БД на середине: задача сама доходит до границы порции,
+    закрывает курсор и сессию.
+    """
+    try:
+        async with read_session() as session:
+            result = await session.stream(query)
+            try:
+                async for partition in result.partitions():
+                    if stop.is_set():
+                        break
+                    await chunks.put(b''.join(
+                        dump_json(ad_from_row(row)) + b'\n' for row in partition
+                    ))
+            finally:
+                await result.close()
+    finally:
+        await chunks.put(None)
+
+
+async def export_ads(request):
+    """Потоковая выгрузка объявлений в NDJSON (по одному объекту на строку).
+
+    Строки читаются серверным курсором порциями по EXPORT_BATCH_SIZE, каждая
+    порция уходит клиенту через await response.write — память не зависит от
+    размера таблицы, а медленный клиент притормаживает чтение из БД.
+    Фильтры: ``?since=<ISO 8601>`` и ``?owner_id=``.
+    """
+    query = (
+        AD_ROWS
+        .order_by(ads.c.created_at, ads.c.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    try:
+        if 'since' in request.query:
+            since = stored_datetime(parse_datetime(request.query['since']))
+            query = query.where(ads.c.created_at >= literal(since, String))
+        if 'owner_id' in request.query:
+            query = query.where(ads.c.owner_id == int(request.query['owner_id']))
+    except ValueError:
+        return web.json_response({"error": "Invalid export filters"}, status=400)
+    
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    
+    chunks = asyncio.Queue(maxsize=2)
+    stop = asyncio.Event()
+    reader = asyncio.create_task(_read_export(query, chunks, stop))
+    try:
+        while (chunk := await chunks.get()) is not None:
+            await response.write(chunk)
+        await reader
+        await response.write_eof()
+    except ConnectionResetError:
+        logger.info("Export aborted: client disconnected")
+    except asyncio.CancelledError:
+        logger.info("Export cancelled: client disconnected")
+        raise
+    except Exception:
+        # Заголовки уже отправлены: обрываем поток без завершающего чанка
+        logger.exception("Export failed")
+    finally:
+        if not reader.done():
+            stop.set()
+            while not chunks.empty():
+                chunks.get_nowait()
+            await asyncio.wait({reader})
+    return response
+
+
+async def get_changes(request):
+    """Инкрементальная лента изменений для синхронизации клиентов и индексаторов.
+
+    ``?since=`` — токен из прошлого ответа (без него — полная выгрузка),
+    ``?limit=`` — размер порции. Изменения идут по возрастанию номера:
+    ``upsert`` с текущим состоянием объявления или ``delete`` по надгробию.
+    Пока ``has_more`` истинно, следующая порция запрашивается с
+    ``next_token``. 410 — токен старше срока хранения надгробий (или от
+    другой базы), нужна полная синхронизация.
+    """
+    try:
+        limit = min(int(request.query.get('limit', CHANGES_BATCH)), CHANGES_MAX_BATCH)
+        if limit < 1:
+            raise ValueError(limit)
+        token = request.query.get('since')
+        since = decode_change_token(token) if token else 0
+    except InvalidCursor:
+        return web.json_response({"error": "Invalid change token"}, status=400)
+    except ValueError:
+        return web.json_response({"error": "Invalid limit"}, status=400)
+    
+    try:
+        async with read_session() as session:
+            high, purged_seq = (await session.execute(CHANGE_STATE)).one()
+            if since > high or since and since < purged_seq:
+                return web.json_response(
+                    {"error": "Change token expired, full resync required"}, status=410
+                )
+            changes = [
+                AdChangeSchema(seq=row[-1], op="upsert", id=row[0], ad=ad_from_row(row))
+                for row in await session.execute(changed_ads_query(since, high, limit + 1))
+            ]
+            # При полной выгрузке удалять у клиента нечего
+            if since:
+                changes += [
+                    AdChangeSchema(seq=seq, op="delete", id=ad_id)
+                    for seq, ad_id in await session.execute(tombstones_query(since, high, limit + 1))
+                ]
+        
+        changes.sort(key=lambda change: change.seq)
+        has_more = len(changes) > limit
+        if has_more:
+            changes = changes[:limit]
+        # Без продолжения всё до high уже получено
+        next_seq = changes[-1].seq if has_more else high
+        return model_response(AdChangesResponseSchema(
+            changes=changes, next_token=encode_change_token(next_seq), has_more=has_more
+        ))
+    except Exception as e:
+        return web.json_response({"error": "Internal server error"}, status=500)
+
+
+async def stream_ads(request):
+    """Живая лента изменений объявлений вместо опроса GET /ads.
+
+    Server-Sent Events (события created, updated, deleted с телом как у
+    GET /ads/{id}) или WebSocket при заголовке Upgrade. Продолжение после
+    обрыва — заголовок Last-Event-ID или ``?last_event_id=``; событие reset
+    означает, что пропущенное не сохранилось и ленту нужно перечитать.
+    """
+    broadcaster = request.app["broadcaster"]
+    if broadcaster.subscribers >= STREAM_MAX_SUBSCRIBERS:
+        return web.json_response({"error": "Too many subscribers"}, status=503,
+                                 headers={"Retry-After": "5"})
+    last_event_id = request.headers.get('Last-Event-ID') or request.query.get('last_event_id')
+    subscriber, reset = broadcaster.subscribe(last_event_id)
+    try:
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            return await ws_stream(request, broadcaster, subscriber, reset)
+        return await sse_stream(request, broadcaster, subscriber, reset)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+@cache_response
 async def get_ad(request):
     """Получение конкретного объявления"""
     try:
         ad_id = int(request.match_info['ad_id'])
         
-        async with async_session() as session:
-            result = await session.execute(
-                select(Advertisement)
-                .options(selectinload(Advertisement.owner_user))
-                .where(Advertisement.id == ad_id)
-            )
-            ad = result.scalar()
+        async with read_session() as session:
+            row = (await session.execute(AD_BY_ID, {'ad_id': ad_id})).first()
             
-            if not ad:
+            if row is None:
                 return web.json_response({"error": "Advertisement not found"}, status=404)
             
-            return web.json_response(
-                AdvertisementResponseSchema.model_validate(ad).model_dump()
-            )
+            response = model_response(ad_from_row(row))
+            response['cache_tags'] = {ad_tag(ad_id)}
+            return response
     except ValueError:
         return web.json_response({"error": "Invalid advertisement ID"}, status=400)
     except Exception as e:
@@ -171,91 +770,163 @@ async def update_ad(request):
     """Полное обновление существующего объявления (PUT)"""
     try:
         ad_id = int(request.match_info['ad_id'])
-        data = await request.json()
+        update_data = await parse_text_body(request, UPDATE_AD)
+        current_user = request['user']
         
-        # Валидируем данные
-        update_data = AdvertisementUpdateSchema(**data)
+        update_values = {}
+        if update_data.title is not None:
+            update_values['title'] = update_data.title
+        if update_data.description is not None:
+            update_values['description'] = update_data.description
         
-        async with async_session() as session:
-            # Проверяем существование объявления
-            result = await session.execute(
-                select(Advertisement).where(Advertisement.id == ad_id)
-            )
-            ad = result.scalar()
-            
-            if not ad:
-                return web.json_response({"error": "Advertisement not found"}, status=404)
-            
-            # Проверяем права доступа (только владелец может редактировать)
-            current_user = request['user']
-            if ad.owner_id != current_user.id:
-                return web.json_response({"error": "Access denied"}, status=403)
-            
-            # Обновляем объявление
-            update_values = {}
-            if update_data.title is not None:
-                update_values['title'] = update_data.title
-            if update_data.description is not None:
-                update_values['description'] = update_data.description
-            
+        async def update_ad_row(session):
+            # Только владелец может редактировать: права проверяются в WHERE,
+            # обновлённая строка возвращается через RETURNING
+            condition = (Advertisement.id == ad_id) & owned_by(current_user)
             if update_values:
-                await session.execute(
+                result = await session.execute(
                     update(Advertisement)
-                    .where(Advertisement.id == ad_id)
+                    .where(condition)
                     .values(**update_values)
+                    .returning(*AD_COLUMNS, AD_IMAGE_NAMES)
+                    .execution_options(synchronize_session=False)
                 )
-                await session.commit()
-            
-            # Возвращаем обновленное объявление
-            result = await session.execute(
-                select(Advertisement)
-                .options(selectinload(Advertisement.owner_user))
-                .where(Advertisement.id == ad_id)
-            )
-            updated_ad = result.scalar()
-            
-            return web.json_response(
-                AdvertisementResponseSchema.model_validate(updated_ad).model_dump()
-            )
-    except ValidationError as e:
-        return web.json_response({"error": "Validation error", "details": e.errors()}, status=400)
+            else:
+                result = await session.execute(select(*AD_COLUMNS, AD_IMAGE_NAMES).where(condition))
+            row = result.one_or_none()
+            if row is None:
+                await raise_missing_or_forbidden(session, ad_id)
+            # Владелец — автор запроса, повторная выборка не нужна
+            return ad_response(row, current_user)
+        
+        def after_commit(ad):
+            if update_values:
+                invalidate_responses(request.app, ad_tag(ad_id), ADS_SEARCH_TAG)
+                publish_ad_event(request.app, "updated", ad)
+        
+        ad = await run_write(update_ad_row, after_commit)
+        return model_response(ad)
+    except InvalidBody as e:
+        return e.response()
+    except web.HTTPNotFound as e:
+        return web.json_response({"error": str(e.reason)}, status=404)
+    except web.HTTPForbidden as e:
+        return web.json_response({"error": str(e.reason)}, status=403)
+    except ValueError:
+        return web.json_response({"error": "Invalid advertisement ID"}, status=400)
+    except Exception as e:
+        return web.json_response({"error": "Internal server error"}, status=500)
+
+
+async def ad_image_names(session, ad_id: int, user) -> list:
+    """Имена файлов изображений объявления с проверкой прав, как у update_ad"""
+    row = (await session.execute(
+        select(ads.c.owner_id, AD_IMAGE_NAMES).where(ads.c.id == ad_id)
+    )).first()
+    if row is None:
+        raise web.HTTPNotFound(reason="Advertisement not found")
+    if row.owner_id != user.id:
+        raise web.HTTPForbidden(reason="Access denied")
+    return row.images.split() if row.images else []
+
+
+@require_auth
+async def upload_ad_images(request):
+    """Загрузка изображений объявления (multipart/form-data, файлы в полях image).
+
+    Права проверяются до приёма файлов и повторно при записи. Файлы пишутся
+    на диск по мере чтения тела; уже загруженный файл не дублируется.
+    Ответ — объявление со списком URL изображений.
+    """
+    try:
+        ad_id = int(request.match_info['ad_id'])
+        current_user = request['user']
+        
+        async with read_session() as session:
+            existing = await ad_image_names(session, ad_id, current_user)
+        if len(existing) >= MAX_IMAGES_PER_AD:
+            raise too_many_images()
+        images = await receive_images(request, MAX_IMAGES_PER_AD - len(existing))
+        await publish_images(images)
+        
+        async def insert_images(session):
+            present = set(await ad_image_names(session, ad_id, current_user))
+            new_images = {}
+            for image in images:
+                if image.filename not in present:
+                    new_images.setdefault(image.filename, image)
+            if len(present) + len(new_images) > MAX_IMAGES_PER_AD:
+                raise too_many_images()
+            if new_images:
+                await session.execute(insert(AdImage), [
+                    {"ad_id": ad_id, "filename": image.filename,
+                     "content_type": image.content_type, "size": image.size}
+                    for image in new_images.values()
+                ])
+            row = (await session.execute(AD_BY_ID, {'ad_id': ad_id})).one()
+            return ad_from_row(row), bool(new_images)
+        
+        def after_commit(outcome):
+            ad, added = outcome
+            if added:
+                invalidate_responses(request.app, ad_tag(ad_id))
+                publish_ad_event(request.app, "updated", ad)
+        
+        ad, _ = await run_write(insert_images, after_commit)
+        return model_response(ad, status=201)
+    except InvalidBody as e:
+        return e.response()
+    except web.HTTPNotFound as e:
+        return web.json_response({"error": str(e.reason)}, status=404)
+    except web.HTTPForbidden as e:
+        return web.json_response({"error": str(e.reason)}, status=403)
     except ValueError:
         return web.json_response({"error": "Invalid advertisement ID"}, status=400)
     except Exception as e:
         return web.json_response({"error": "Internal server error"}, status=500)
 
 
+async def get_image(request):
+    """Файл изображения через FileResponse: sendfile, Range, ETag, Last-Modified и 304"""
+    filename = request.match_info['name']
+    path = image_path(filename)
+    if not await asyncio.get_running_loop().run_in_executor(None, os.path.isfile, path):
+        return web.json_response({"error": "Image not found"}, status=404)
+    return web.FileResponse(path, headers=image_headers(filename))
+
+
 @require_auth
 async def delete_ad(request):
     """Удаление объявления"""
     try:
         ad_id = int(request.match_info['ad_id'])
+        current_user = request['user']
         
-        async with async_session() as session:
-            # Проверяем существование объявления
+        async def delete_ad_row(session):
+            # Только владелец может удалять: права проверяются в WHERE
             result = await session.execute(
-                select(Advertisement).where(Advertisement.id == ad_id)
-            )
-            ad = result.scalar()
-            
-            if not ad:
-                return web.json_response({"error": "Advertisement not found"}, status=404)
-            
-            # Проверяем права доступа (только владелец может удалять)
-            current_user = request['user']
-            if ad.owner_id != current_user.id:
-                return web.json_response({"error": "Access denied"}, status=403)
-            
-            # Удаляем объявление
-            await session.execute(
-                delete(Advertisement).where(Advertisement.id == ad_id)
-            )
-            await session.commit()
-            
-            return web.json_response(
-                {"message": "Advertisement deleted successfully"},
-                status=200
+                delete(Advertisement)
+                .where(Advertisement.id == ad_id, owned_by(current_user))
+                .execution_options(synchronize_session=False)
             )
+            if result.rowcount == 0:
+                await raise_missing_or_forbidden(session, ad_id)
+            await change_ad_count(session, current_user.id, -1)
+        
+        def after_commit(_):
+            invalidate_responses(request.app, ad_tag(ad_id), ADS_LIST_TAG)
+            publish_ad_event(request.app, "deleted", {"id": ad_id})
+        
+        await run_write(delete_ad_row, after_commit)
+        
+        return web.json_response(
+            {"message": "Advertisement deleted successfully"},
+            status=200
+        )
+    except web.HTTPNotFound as e:
+        return web.json_response({"error": str(e.reason)}, status=404)
+    except web.HTTPForbidden as e:
+        return web.json_response({"error": str(e.reason)}, status=403)
     except ValueError:
         return web.json_response({"error": "Invalid advertisement ID"}, status=400)
     except Exception as e:
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+
+from app.database import async_session
+from app.metrics import current_request_db, request_db_scope
+
+
+# Единственный писатель: транзакции записи выполняются по очереди одной
+# задачей, накопившиеся заявки фиксируются одним COMMIT (group commit)
+DATABASE_WRITE_QUEUE = os.getenv("DATABASE_WRITE_QUEUE", "true").lower() in ("1", "true", "yes")
+DATABASE_WRITE_BATCH = int(os.getenv("DATABASE_WRITE_BATCH", "64"))
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    """Очередь транзакций записи с групповой фиксацией.
+
+    Заявка — корутина job(session), выполняющая запись без commit. Каждая
+    заявка идёт в своём SAVEPOINT: исключение откатывает только её и
+    возвращается вызвавшему, остальные заявки пачки фиксируются.
+
+    Действия после записи (сброс кеша ответов, публикация события) заявка
+    передаёт в on_commit: писатель вызывает его сразу после COMMIT, даже
+    если вызвавший уже отменён (клиент отключился), — иначе
+    зафиксированное изменение осталось бы без инвалидации.
+    """
+
+    def __init__(self, session_factory, max_batch: int = DATABASE_WRITE_BATCH):
+        self._session_factory = session_factory
+        self._max_batch = max_batch
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.jobs = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if not self.running:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            await self._queue.put(None)
+            await self._task
+        self._task = None
+
+    async def submit(self, job, on_commit=None):
+        """Выполнение job(session) в транзакции записи; возвращает результат job.
+
+        on_commit(результат) — синхронная функция, вызывается после COMMIT.
+        """
+        if not self.running:
+            # Писатель не запущен (скрипты, отдельные вызовы) — пишем напрямую
+            async with self._session_factory() as session:
+                async with session.begin():
+                    result = await job(session)
+            _after_commit(on_commit, result)
+            return result
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((job, future, current_request_db(), on_commit))
+        return await future
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            while len(batch) < self._max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._execute(batch)
+            if stopping:
+                return
+
+    async def _execute(self, batch):
+        outcomes = []
+        try:
+            async with self._session_factory() as session:
+                async with session.begin():
+                    for job, future, request_db, on_commit in batch:
+                        # Заявка, отменённая до выполнения, не записывается
+                        if future.done():
+                            continue
+                        try:
+                            with request_db_scope(request_db):
+                                async with session.begin_nested():
+                                    result = await job(session)
+                            outcomes.append((future, result, None, on_commit))
+                        except Exception as e:
+                            outcomes.append((future, None, e, None))
+        except Exception as e:
+            logger.exception("Group commit of %d write jobs failed", len(batch))
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.jobs += len(outcomes)
+        for future, result, error, on_commit in outcomes:
+            if error is None:
+                _after_commit(on_commit, result)
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def _after_commit(on_commit, result):
+    if on_commit is None:
+        return
+    try:
+        on_commit(result)
+    except Exception:
+        logger.exception("Post-commit hook failed")
+
+
+write_queue = WriteQueue(async_session)
+
+
+async def run_write(job, on_commit=None):
+    """Выполнение транзакции записи через общего писателя"""
+    return await write_queue.submit(job, on_commit)
+
+
+async def start_writer(app):
+    if DATABASE_WRITE_QUEUE:
+        await write_queue.start()
+
+
+async def stop_writer(app):
+    await write_queue.stop()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Проверка ключей кеша ответов на коллизии.
+
+Разные запросы должны давать разные ключи: закодированные %26 (&) и %3D (=)
+внутри имени или значения параметра не должны совпадать с настоящими
+параметрами. Иначе запрос вроде /ads?page%3D2%26per_page=10 закеширует
+первую страницу под ключом второй. При коллизии скрипт печатает пары
+и завершается с кодом 1.
+
+    python -m benchmarks.cache_keys
+"""
+import sys
+
+from aiohttp.test_utils import make_mocked_request
+
+from app.response_cache import cache_key
+
+
+# Пары URL, которые обязаны давать разные ключи
+DISTINCT = (
+    ("/ads?page%3D2%26per_page=10", "/ads?page=2&per_page=10"),
+    ("/ads?per_page=2%26zz%3D1", "/ads?per_page=2&zz=1"),
+    ("/ads/search?q=X%26zz%3D1", "/ads/search?q=X&zz=1"),
+    ("/ads?a=1%26b", "/ads?a=1&b"),
+    ("/ads?a%3D=1", "/ads?a==1"),
+    ("/ads%3Fpage=2", "/ads?page=2"),
+)
+
+# Пары, которые обязаны совпасть: порядок параметров не важен
+SAME = (
+    ("/ads?per_page=10&page=2", "/ads?page=2&per_page=10"),
+    ("/ads/search?q=%D0%B2%D0%B5%D0%BB", "/ads/search?q=вел"),
+)
+
+
+def key(url: str) -> str:
+    return cache_key(make_mocked_request("GET", url))
+
+
+def main():
+    ok = True
+    for first, second in DISTINCT:
+        if key(first) == key(second):
+            ok = False
+            print(f"FAIL collision: {first} and {second} -> {key(first)}")
+    for first, second in SAME:
+        if key(first) != key(second):
+            ok = False
+            print(f"FAIL mismatch: {first} -> {key(first)}, {second} -> {key(second)}")
+    print("ok" if ok else "cache key check failed")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Нагрузочный прогон приложения в том же процессе (без сети наружу).
+
+Поднимает init_app() на локальном порту поверх одноразовой базы, гоняет
+смешанные сценарии конкурентными клиентами и печатает пропускную
+способность и p50/p95/p99 по маршрутам.
+
+    python -m benchmarks.load --scenario mixed --duration 10 --concurrency 16
+    python -m benchmarks.load --save-baseline benchmarks/baseline.json
+    python -m benchmarks.load --compare benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.report import (
+    LatencyRecorder, build_report, format_report, compare_reports, save_report, load_report
+)
+from benchmarks.seed import seed, bench_username, BENCH_PASSWORD
+
+
+# Веса операций в сценариях
+SCENARIOS = {
+    "mixed": {
+        "list_first_page": 30, "list_deep_offset": 5, "list_deep_cursor": 5,
+        "get_by_id": 40, "create_ad": 8, "update_ad": 10, "login": 2,
+    },
+    "read": {
+        "list_first_page": 40, "list_deep_offset": 10, "list_deep_cursor": 10, "get_by_id": 40,
+    },
+    "write": {"create_ad": 50, "update_ad": 50},
+    "login": {"login": 100},
+}
+
+PER_PAGE = 20
+
+
+class LoadContext:
+    """Данные из засеянной базы, нужные сценариям"""
+
+    def __init__(self, db_path: str, users: int, rng: random.Random):
+        from app.auth import create_access_token
+        from app.pagination import encode_cursor
+
+        self.rng = rng
+        self.users = users
+        conn = sqlite3.connect(db_path)
+        try:
+            self.max_ad_id = conn.execute("SELECT max(id) FROM advertisements").fetchone()[0] or 1
+            total = conn.execute("SELECT count(*) FROM advertisements").fetchone()[0]
+            self.deep_page = max(1, (total // PER_PAGE) * 9 // 10)
+            row = conn.execute(
+                "SELECT created_at, id FROM advertisements "
+                "ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?",
+                ((self.deep_page - 1) * PER_PAGE - 1,)
+            ).fetchone()
+            self.deep_cursor = encode_cursor(*row) if row else ""
+            self.owned = {}
+            for ad_id, owner_id in conn.execute("SELECT id, owner_id FROM advertisements"):
+                self.owned.setdefault(owner_id, []).append(ad_id)
+        finally:
+            conn.close()
+        self.headers = {
+            user_id: {"Authorization": "Bearer " + create_access_token({"sub": bench_username(user_id)})}
+            for user_id in range(1, users + 1)
+        }
+
+
+async def _request(client, method, url, **kwargs) -> bool:
+    async with client.request(method, url, **kwargs) as response:
+        await response.read()
+        return response.status < 400
+
+
+async def list_first_page(client, ctx):
+    return await _request(client, "GET", f"/ads?page=1&per_page={PER_PAGE}")
+
+
+async def list_deep_offset(client, ctx):
+    return await _request(client, "GET", f"/ads?page={ctx.deep_page}&per_page={PER_PAGE}")
+
+
+async def list_deep_cursor(client, ctx):
+    return await _request(client, "GET", f"/ads?cursor={ctx.deep_cursor}&per_page={PER_PAGE}")
+
+
+async def get_by_id(client, ctx):
+    return await _request(client, "GET", f"/ads/{ctx.rng.randint(1, ctx.max_ad_id)}")
+
+
+async def create_ad(client, ctx):
+    user_id = ctx.rng.randint(1, ctx.users)
+    return await _request(client, "POST", "/ads", headers=ctx.headers[user_id], json={
+        "title": "Новое объявление", "description": "Описание " * 20, "owner_id": user_id
+    })
+
+
+async def update_ad(client, ctx):
+    user_id = ctx.rng.choice(list(ctx.owned))
+    ad_id = ctx.rng.choice(ctx.owned[user_id])
+    return await _request(client, "PUT", f"/ads/{ad_id}", headers=ctx.headers[user_id], json={
+        "title": f"Обновлено {ctx.rng.random():.6f}"
+    })
+
+
+async def login(client, ctx):
+    return await _request(client, "POST", "/auth/login", json={
+        "username": bench_username(ctx.rng.randint(1, ctx.users)), "password": BENCH_PASSWORD
+    })
+
+
+OPERATIONS = {
+    "list_first_page": list_first_page,
+    "list_deep_offset": list_deep_offset,
+    "list_deep_cursor": list_deep_cursor,
+    "get_by_id": get_by_id,
+    "create_ad": create_ad,
+    "update_ad": update_ad,
+    "login": login,
+}
+
+
+async def _worker(client, ctx, weights, recorder, deadline):
+    names = list(weights)
+    cumulative = list(weights.values())
+    while time.perf_counter() < deadline:
+        name = ctx.rng.choices(names, weights=cumulative)[0]
+        started = time.perf_counter()
+        try:
+            ok = await OPERATIONS[name](client, ctx)
+        except Exception:
+            ok = False
+        recorder.record(name, time.perf_counter() - started, ok)
+
+
+async def run_load(db_path: str, users: int, scenario: str = "mixed", duration: float = 10,
+                   concurrency: int = 16, rng_seed: int = 0) -> dict:
+    """Прогон сценария; база уже должна быть засеяна, DATABASE_URL выставлен"""
+    from aiohttp.test_utils import TestClient, TestServer
+    from app import init_app
+    from app.database import engine
+
+    engine.echo = False
+    ctx = LoadContext(db_path, users, random.Random(rng_seed))
+    client = TestClient(TestServer(await init_app()))
+    await client.start_server()
+    recorder = LatencyRecorder()
+    try:
+        # Прогрев: кеши, пулы, скомпилированные запросы
+        for name in SCENARIOS[scenario]:
+            await OPERATIONS[name](client, ctx)
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            _worker(client, ctx, SCENARIOS[scenario], recorder, deadline)
+            for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.close()
+        await engine.dispose()
+    return recorder.summary(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--ads", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="путь к одноразовой базе (по умолчанию временный файл)")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="aiohttp-bench-"), "bench.db")
+    # Приложение читает DATABASE_URL при импорте app.database
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    seeded = seed(db_path, args.users, args.ads, args.seed)
+    print(f"seeded {seeded['users']} users / {seeded['ads']} ads in {seeded['seconds']} s")
+
+    summary = asyncio.run(run_load(
+        db_path, args.users, args.scenario, args.duration, args.concurrency, args.seed
+    ))
+    report = build_report(summary, {
+        "scenario": args.scenario, "duration_s": args.duration, "concurrency": args.concurrency,
+        "users": args.users, "ads": args.ads, "seed": args.seed,
+    })
+    print(format_report(report))
+    if args.compare:
+        print()
+        print(compare_reports(report, load_report(args.compare)))
+    if args.save_baseline:
+        save_report(report, args.save_baseline)
+        print(f"baseline saved to {args.save_baseline}")
+    if not args.db:
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
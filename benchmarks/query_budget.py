@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Бюджет запросов к БД по маршрутам.
+
+Выполняет типовые запросы к приложению в том же процессе и считает
+команды, ушедшие в БД (включая BEGIN, SAVEPOINT и RELEASE). Если маршрут
+превысил бюджет, печатает его запросы и завершается с кодом 1 — проверку
+можно ставить в CI.
+
+    python -m benchmarks.query_budget
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+from sqlalchemy import event
+
+from benchmarks.seed import seed, bench_username
+
+
+# Бюджеты прогретых маршрутов (principal уже в кеше, ответ ещё не закеширован).
+# Запись в очереди писателя: BEGIN IMMEDIATE + SAVEPOINT/RELEASE на заявку.
+BUDGETS = {
+    "POST /ads": 5,
+    "POST /ads (other owner)": 6,
+    "PUT /ads/{id}": 4,
+    "PUT /ads/{id} forbidden": 5,
+    "PUT /ads/{id} not found": 5,
+    "DELETE /ads/{id}": 5,
+    "DELETE /ads/batch": 5,
+    "GET /ads/{id}": 2,
+    "GET /ads": 3,
+    "GET /ads?cursor": 2,
+    "GET /users/{id}/ads": 3,
+}
+
+
+class QueryLog:
+    """Запросы, отправленные через движки приложения внутри блока with"""
+
+    def __init__(self, engines):
+        self.engines = [engine.sync_engine for engine in engines]
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(" ".join(statement.split()))
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._record)
+
+
+async def check_budgets(verbose: bool = False) -> bool:
+    from aiohttp.test_utils import TestClient, TestServer
+    from app import init_app
+    from app.auth import create_access_token
+    from app.database import engine, read_engine
+
+    engines = {engine, read_engine}
+    client = TestClient(TestServer(await init_app()))
+    await client.start_server()
+    headers = {
+        user_id: {"Authorization": "Bearer " + create_access_token({"sub": bench_username(user_id)})}
+        for user_id in (1, 2)
+    }
+    ok = True
+
+    async def measure(name, method, path, user_id=1, **kwargs):
+        nonlocal ok
+        with QueryLog(engines) as log:
+            async with client.request(method, path, headers=headers[user_id], **kwargs) as response:
+                body = await response.json()
+        budget = BUDGETS[name]
+        failed = len(log.statements) > budget
+        ok = ok and not failed
+        print(f"{'FAIL' if failed else 'ok':4} {name:28} {len(log.statements):3} / {budget:<3} HTTP {response.status}")
+        if failed or verbose:
+            for statement in log.statements:
+                print(f"       {statement[:160]}")
+        return body
+
+    try:
+        # Прогрев: principal обоих пользователей в кеше, пулы открыты
+        for user_id in headers:
+            await client.put("/ads/0", headers=headers[user_id], json={"title": "warm-up"})
+            await client.get("/ads?per_page=1")
+
+        ad = await measure("POST /ads", "POST", "/ads",
+                           json={"title": "budget", "description": "check", "owner_id": 1})
+        await measure("POST /ads (other owner)", "POST", "/ads",
+                      json={"title": "budget", "description": "check", "owner_id": 2})
+        await measure("PUT /ads/{id}", "PUT", f"/ads/{ad['id']}", json={"title": "budget 2"})
+        await measure("PUT /ads/{id} forbidden", "PUT", f"/ads/{ad['id']}", user_id=2,
+                      json={"title": "stolen"})
+        await measure("PUT /ads/{id} not found", "PUT", "/ads/999999999", json={"title": "none"})
+        await measure("GET /ads/{id}", "GET", f"/ads/{ad['id']}")
+        await measure("GET /ads", "GET", "/ads?per_page=20")
+        await measure("GET /ads?cursor", "GET", "/ads?per_page=20&cursor=&count=none")
+        await measure("GET /users/{id}/ads", "GET", "/users/1/ads?per_page=20")
+        await measure("DELETE /ads/{id}", "DELETE", f"/ads/{ad['id']}")
+        second = await client.post("/ads", headers=headers[1],
+                                   json={"title": "budget", "description": "check", "owner_id": 1})
+        second_id = (await second.json())["id"]
+        await measure("DELETE /ads/batch", "DELETE", f"/ads/batch?ids={second_id}")
+    finally:
+        await client.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="печатать запросы всех маршрутов")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="ads-budget-"), "budget.db")
+    # Приложение читает DATABASE_URL при импорте app.database
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    seed(db_path, users=2, ads=200)
+    raise SystemExit(0 if asyncio.run(check_budgets(args.verbose)) else 1)
+
+
+if __name__ == "__main__":
+    main()
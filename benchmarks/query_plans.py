@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Проверка планов запросов ленты через EXPLAIN QUERY PLAN.
+
+Каждый вариант списка (первая страница, курсор, владелец, интервал дат)
+должен идти поиском по индексу: без полного сканирования таблицы
+и без временного B-дерева для ORDER BY. При нарушении скрипт печатает
+план и завершается с кодом 1.
+
+    python -m benchmarks.query_plans --ads 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select, func
+
+from benchmarks.seed import seed
+
+
+# Признаки плохого плана в выводе EXPLAIN QUERY PLAN
+FULL_SCAN = "SCAN advertisements"
+TEMP_SORT = "USE TEMP B-TREE"
+
+# Запросы без условий, которым достаточно обхода индекса
+UNFILTERED = ("first page",)
+
+
+def explain(connection, statement) -> list:
+    """Строки EXPLAIN QUERY PLAN для запроса SQLAlchemy"""
+    compiled = statement.compile(dialect=connection.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    result = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+    return [row[-1] for row in result]
+
+
+def plan_problems(plan: list, index_scan_ok: bool = False) -> list:
+    """Нарушения: просмотр таблицы или сортировка во временном дереве.
+
+    Упорядоченный обход индекса ("SCAN ... USING INDEX") допустим только
+    для ленты без условий, где его обрезает LIMIT; запрос с фильтром
+    обязан сужать диапазон индекса (SEARCH).
+    """
+    problems = []
+    for line in plan:
+        if line.startswith(FULL_SCAN) and not (index_scan_ok and "USING" in line):
+            problems.append(line)
+        if line.startswith(TEMP_SORT):
+            problems.append(line)
+    return problems
+
+
+def list_queries(owner_id: int, position) -> dict:
+    """Запросы, которые строят лента /ads, /users/{id}/ads и /ads/changes"""
+    from app.changes import changed_ads_query, tombstones_query
+    from app.models import Advertisement
+    from app.pagination import ads_filters, ads_page_query
+
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    now = datetime.utcnow()
+    by_owner = ads_filters(owner_id=owner_id)
+    by_dates = ads_filters(created_after=week_ago, created_before=now)
+    by_both = ads_filters(owner_id, week_ago, now)
+    return {
+        "first page": ads_page_query(20),
+        "cursor page": ads_page_query(20, position=position),
+        "owner": ads_page_query(20, by_owner),
+        "owner cursor": ads_page_query(20, by_owner, position),
+        "date range": ads_page_query(20, by_dates),
+        "date range cursor": ads_page_query(20, by_dates, position),
+        "owner date range": ads_page_query(20, by_both),
+        "owner count": select(func.count(Advertisement.id)).where(*by_owner),
+        "date range count": select(func.count(Advertisement.id)).where(*by_dates),
+        "changes": changed_ads_query(100, 1 << 30, 500),
+        "tombstones": tombstones_query(100, 1 << 30, 500),
+    }
+
+
+def check(db_path: str, verbose: bool = False) -> bool:
+    """Проверка всех запросов; True, если планы в порядке"""
+    from app.pagination import created_at_raw
+    from app.models import Advertisement
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    ok = True
+    with engine.connect() as connection:
+        owner_id, created_at = connection.execute(
+            select(Advertisement.owner_id, created_at_raw)
+            .order_by(Advertisement.id)
+            .limit(1)
+        ).one()
+        for name, statement in list_queries(owner_id, (created_at, 1 << 30)).items():
+            plan = explain(connection, statement)
+            problems = plan_problems(plan, index_scan_ok=name in UNFILTERED)
+            ok = ok and not problems
+            print(f"{'FAIL' if problems else 'ok':4} {name}")
+            if problems or verbose:
+                for line in plan:
+                    print(f"       {line}")
+    engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--ads", type=int, default=20000)
+    parser.add_argument("--db", help="готовая база вместо временной")
+    parser.add_argument("--verbose", action="store_true", help="печатать все планы")
+    args = parser.parse_args()
+
+    if args.db:
+        db_path = args.db
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="ads-plans-"), "plans.db")
+    # Приложение читает DATABASE_URL при импорте app.database
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    if not args.db:
+        seed(db_path, users=args.users, ads=args.ads)
+    sys.exit(0 if check(db_path, args.verbose) else 1)
+
+
+if __name__ == "__main__":
+    main()
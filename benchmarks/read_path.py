@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Сравнение путей чтения страницы объявлений: ORM и Core.
+
+ORM — прежний путь: объекты Advertisement, второй запрос selectinload
+за владельцами и model_validate(from_attributes). Core — app.reads:
+одна строка JOIN на объявление и схемы через model_construct. Оба пути
+отдают одинаковый JSON; меряется задержка на страницу и пик памяти,
+выделенной за время её построения (tracemalloc).
+
+    python -m benchmarks.read_path [--per-page 100] [--repeat 200]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.seed import seed
+
+
+async def orm_page(session, per_page: int) -> bytes:
+    from sqlalchemy import select, String, type_coerce
+    from sqlalchemy.orm import selectinload
+    from app.models import Advertisement
+    from app.schemas import AdvertisementResponseSchema, AdvertisementListResponseSchema
+    from app.serialization import dump_json
+
+    result = await session.execute(
+        select(Advertisement, type_coerce(Advertisement.created_at, String).label('created_at_raw'))
+        .options(selectinload(Advertisement.owner_user))
+        .order_by(Advertisement.created_at.desc(), Advertisement.id.desc())
+        .limit(per_page + 1)
+    )
+    rows = result.all()[:per_page]
+    body = dump_json(AdvertisementListResponseSchema(
+        items=[AdvertisementResponseSchema.model_validate(ad) for ad, _ in rows],
+        per_page=per_page
+    ))
+    # Как и обработчик, сессия не живёт дольше запроса
+    session.expunge_all()
+    return body
+
+
+async def core_page(session, per_page: int) -> bytes:
+    from app.pagination import ads_page_query
+    from app.reads import ad_from_row
+    from app.schemas import AdvertisementListResponseSchema
+    from app.serialization import dump_json
+
+    result = await session.execute(ads_page_query(per_page))
+    rows = result.all()[:per_page]
+    return dump_json(AdvertisementListResponseSchema(
+        items=[ad_from_row(row) for row in rows], per_page=per_page
+    ))
+
+
+async def measure(page, per_page: int, repeat: int) -> dict:
+    from app.database import read_session
+
+    async with read_session() as session:
+        for _ in range(10):
+            await page(session, per_page)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await page(session, per_page)
+            timings.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            await page(session, per_page)
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+    return {
+        "p50_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+async def run(per_page: int, repeat: int):
+    from app.database import read_session, read_engine
+
+    async with read_session() as session:
+        orm_body = await orm_page(session, per_page)
+        core_body = await core_page(session, per_page)
+    assert orm_body == core_body, "ORM и Core дают разный JSON"
+
+    results = {}
+    for name, page in (("orm", orm_page), ("core", core_page)):
+        results[name] = stats = await measure(page, per_page, repeat)
+        print(f"{name:>5}: p50 {stats['p50_ms']:.3f} ms, min {stats['min_ms']:.3f} ms, "
+              f"peak {stats['peak_kib']:.1f} KiB per {per_page}-row page")
+    print(f"speedup (p50): {results['orm']['p50_ms'] / results['core']['p50_ms']:.2f}x, "
+          f"memory: {results['orm']['peak_kib'] / results['core']['peak_kib']:.2f}x less")
+    await read_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--ads", type=int, default=5000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="ads-read-"), "read.db")
+    # Приложение читает DATABASE_URL при импорте app.database
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    seed(db_path, users=100, ads=args.ads)
+    asyncio.run(run(args.per_page, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Сбор задержек, перцентили и сравнение с сохранённым baseline"""
+import json
+import math
+import platform
+import time
+
+
+def percentile(sorted_values, q: float) -> float:
+    """Перцентиль по ближайшему рангу (значения уже отсортированы)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LatencyRecorder:
+    """Задержки и ошибки по маршрутам"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, route: str, seconds: float, ok: bool):
+        self.latencies.setdefault(route, []).append(seconds)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        routes = {}
+        for route, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors.get(route, 0),
+                "rps": round(len(values) / elapsed, 1),
+                "mean_ms": round(sum(values) / len(values) * 1000, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+        total = sum(route["count"] for route in routes.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "total_requests": total,
+            "total_rps": round(total / elapsed, 1) if elapsed else 0.0,
+            "routes": routes,
+        }
+
+
+def build_report(summary: dict, params: dict) -> dict:
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            **params,
+        },
+        **summary,
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{'route':<28}{'count':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    ]
+    for route, stats in report["routes"].items():
+        lines.append(
+            f"{route:<28}{stats['count']:>8}{stats['errors']:>6}{stats['rps']:>9}"
+            f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+        )
+    lines.append(
+        f"total: {report['total_requests']} requests in {report['elapsed_s']} s "
+        f"({report['total_rps']} rps)"
+    )
+    return "\n".join(lines)
+
+
+def _delta(new: float, old: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare_reports(report: dict, baseline: dict) -> str:
+    """Сравнение с baseline: для задержек минус — лучше, для rps — плюс"""
+    lines = [f"{'route':<28}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}"]
+    for route, stats in report["routes"].items():
+        old = baseline.get("routes", {}).get(route)
+        if old is None:
+            lines.append(f"{route:<28}{'new':>10}")
+            continue
+        lines.append(
+            f"{route:<28}{_delta(stats['rps'], old['rps']):>10}"
+            f"{_delta(stats['p50_ms'], old['p50_ms']):>10}"
+            f"{_delta(stats['p95_ms'], old['p95_ms']):>10}"
+            f"{_delta(stats['p99_ms'], old['p99_ms']):>10}"
+        )
+    return "\n".join(lines)
+
+
+def save_report(report: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def load_report(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
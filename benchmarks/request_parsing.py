@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Микробенчмарк разбора тел запросов.
+
+Сравнивает прежний путь (json.loads -> dict -> Schema(**data)), разбор
+байтов сразу в схему через TypeAdapter.validate_json и путь приложения
+(app.request_body): validate_json для входа, json.loads + validate_python
+для объявлений и пакета. Длинные строки не-ASCII парсер JSON
+pydantic-core 2.14 декодирует медленнее, чем json из стандартной
+библиотеки: на кириллице validate_json не быстрее прежнего пути, а на
+большом пакете медленнее. Замеры шумные, поэтому пути чередуются в
+нескольких раундах и печатается медиана отношения к прежнему пути.
+
+    python -m benchmarks.request_parsing [--batch 100] [--repeat 2000] [--rounds 9]
+"""
+import argparse
+import json
+import statistics
+import timeit
+
+from app.request_body import CREATE_AD, CREATE_ADS_BATCH, LOGIN, load_json
+from app.schemas import AdvertisementCreateSchema, LoginSchema
+
+
+def make_bodies(batch: int) -> dict:
+    """Тела в том виде, в каком их шлют клиенты: UTF-8 без \\u-экранирования"""
+    def ad(description: str) -> dict:
+        return {"title": "Объявление", "description": description * 90, "owner_id": 1}
+
+    def encode(data) -> bytes:
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    return {
+        "ad ascii": encode(ad("Ad description. ")),
+        "ad cyrillic": encode(ad("Описание объявления. ")),
+        "login": encode({"username": "benchmark_user", "password": "benchmark-password"}),
+        "batch": encode([ad("Описание объявления. ")] * batch),
+    }
+
+
+def legacy_one(schema):
+    return lambda body: schema(**json.loads(body))
+
+
+def legacy_batch(body):
+    return [AdvertisementCreateSchema(**item) for item in json.loads(body)]
+
+
+def app_text(adapter):
+    # Как parse_text_body и parse_batch_body для валидного тела
+    return lambda body: adapter.validate_python(load_json(body))
+
+
+CASES = (
+    ("ad ascii", legacy_one(AdvertisementCreateSchema), CREATE_AD.validate_json, app_text(CREATE_AD)),
+    ("ad cyrillic", legacy_one(AdvertisementCreateSchema), CREATE_AD.validate_json, app_text(CREATE_AD)),
+    ("login", legacy_one(LoginSchema), LOGIN.validate_json, LOGIN.validate_json),
+    ("batch", legacy_batch, CREATE_ADS_BATCH.validate_json, app_text(CREATE_ADS_BATCH)),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=9)
+    args = parser.parse_args()
+
+    bodies = make_bodies(args.batch)
+    for name, legacy, direct, app in CASES:
+        body = bodies[name]
+        assert legacy(body) == direct(body) == app(body)
+        number = max(1, args.repeat // args.batch) if name == "batch" else args.repeat
+        legacy_rates, ratios = [], {"validate_json": [], "app": []}
+        for _ in range(args.rounds):
+            rates = {}
+            for label, func in (("legacy", legacy), ("validate_json", direct), ("app", app)):
+                seconds = min(timeit.repeat(lambda: func(body), number=number, repeat=3))
+                rates[label] = number / seconds
+            legacy_rates.append(rates["legacy"])
+            for label in ratios:
+                ratios[label].append(rates[label] / rates["legacy"])
+        print(f"{name:>11} ({len(body)} B): legacy {statistics.median(legacy_rates):,.0f}/s, "
+              f"validate_json {statistics.median(ratios['validate_json']):.2f}x, "
+              f"app {statistics.median(ratios['app']):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
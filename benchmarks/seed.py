@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Наполнение одноразовой SQLite-базы пользователями и объявлениями.
+
+    python -m benchmarks.seed /tmp/bench.db --users 100 --ads 100000
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+
+# Пароль всех сгенерированных пользователей (для сценария входа)
+BENCH_PASSWORD = "benchmark-password"
+INSERT_BATCH = 5000
+
+
+def bench_username(index: int) -> str:
+    return f"bench_user_{index}"
+
+
+def seed(path: str, users: int = 100, ads: int = 10000, rng_seed: int = 0) -> dict:
+    """Создание базы по пути path (существующий файл перезаписывается)"""
+    # Импорт app создаёт движок по DATABASE_URL, поэтому он отложен до вызова
+    from app.auth import hash_password
+    from app.models import User, Advertisement, create_schema, reseed_ad_counters
+
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(rng_seed)
+    engine = create_engine(f"sqlite:///{path}")
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        create_schema(conn)
+        password_hash = hash_password(BENCH_PASSWORD)
+        registered = datetime(2020, 1, 1)
+        conn.execute(User.__table__.insert(), [
+            {
+                "id": i, "username": bench_username(i), "email": f"{bench_username(i)}@example.com",
+                "password_hash": password_hash, "created_at": registered
+            }
+            for i in range(1, users + 1)
+        ])
+        created_at = datetime(2021, 1, 1)
+        for offset in range(0, ads, INSERT_BATCH):
+            rows = []
+            for i in range(offset + 1, min(offset + INSERT_BATCH, ads) + 1):
+                # Несколько объявлений в секунду — есть совпадения created_at
+                created_at += timedelta(seconds=rng.randint(0, 2))
+                rows.append({
+                    "id": i, "title": f"Объявление {i}",
+                    "description": "Описание объявления. " * rng.randint(1, 50),
+                    "created_at": created_at, "owner_id": rng.randint(1, users)
+                })
+            conn.execute(Advertisement.__table__.insert(), rows)
+        reseed_ad_counters(conn)
+    engine.dispose()
+    return {"users": users, "ads": ads, "seconds": round(time.perf_counter() - started, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--ads", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    result = seed(args.path, args.users, args.ads, args.seed)
+    print(f"Создано {result['users']} пользователей и {result['ads']} объявлений "
+          f"за {result['seconds']} с: {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Микробенчмарк сериализации страницы объявлений.
+
+Сравнивает прежний путь (model_validate -> model_dump с ручным переводом
+дат в ISO и переименованием owner_user -> owner -> json.dumps в
+web.json_response) с прямой сериализацией в байты через pydantic-core
+(app.serialization.dump_json). Прежние переопределения model_dump
+воспроизведены здесь, в схемах их больше нет.
+
+    python -m benchmarks.serialization [--items 100] [--repeat 200]
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.schemas import AdvertisementResponseSchema, AdvertisementListResponseSchema
+from app.serialization import dump_json
+
+
+def make_rows(count: int):
+    """Объекты с атрибутами как у ORM-моделей (from_attributes)"""
+    owner = SimpleNamespace(
+        id=1, username="benchmark_user", email="bench@example.com",
+        created_at=datetime(2024, 1, 1, 12, 0, 0)
+    )
+    return [
+        SimpleNamespace(
+            id=i, title=f"Объявление {i}", description="Описание " * 200,
+            created_at=datetime(2024, 1, 2, 12, 0, i % 60, 123456),
+            owner_id=owner.id, owner_user=owner
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_item(item: AdvertisementResponseSchema) -> dict:
+    """Прежний AdvertisementResponseSchema.model_dump: даты в ISO, owner_user -> owner"""
+    data = item.model_dump()
+    data["created_at"] = data["created_at"].isoformat()
+    owner = data.pop("owner_user")
+    owner["created_at"] = owner["created_at"].isoformat()
+    data["owner"] = owner
+    return data
+
+
+def legacy_page(rows) -> bytes:
+    items = [AdvertisementResponseSchema.model_validate(ad) for ad in rows]
+    page = AdvertisementListResponseSchema(
+        items=items, total=len(rows), page=1, per_page=len(rows), pages=1
+    )
+    # Как прежний AdvertisementListResponseSchema.model_dump: общий dump,
+    # затем элементы заново через свой model_dump
+    data = page.model_dump()
+    data["items"] = [legacy_item(item) for item in page.items]
+    return json.dumps(data).encode("utf-8")
+
+
+def direct_page(rows) -> bytes:
+    items = [AdvertisementResponseSchema.model_validate(ad) for ad in rows]
+    return dump_json(AdvertisementListResponseSchema(
+        items=items, total=len(rows), page=1, per_page=len(rows), pages=1
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.items)
+    assert json.loads(legacy_page(rows)) == json.loads(direct_page(rows))
+
+    results = {}
+    for name, func in (("legacy", legacy_page), ("direct", direct_page)):
+        seconds = min(timeit.repeat(lambda: func(rows), number=args.repeat, repeat=3))
+        results[name] = seconds / args.repeat * 1000
+        print(f"{name:>7}: {results[name]:.3f} ms/page ({args.items} items)")
+    print(f"speedup: {results['legacy'] / results['direct']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
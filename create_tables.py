@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 import asyncio
-from app.models import Base
+from app.models import create_schema
 from app.database import engine
 
 
 async def create_tables():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_schema)
     print("Таблицы созданы успешно!")
 
 
@@ -1,32 +1,132 @@
 from app import init_app
+import argparse
 import asyncio
+import multiprocessing
+import os
+import signal
+import time
 from aiohttp import web
-from app.models import Base
+from app.models import create_schema
+from sqlalchemy.ext.asyncio import create_async_engine
 from app.database import engine
+from app.response_cache import share_invalidations
+from app.lifecycle import drain
+
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8080"))
+# Количество процессов-воркеров; 1 — обычный однопроцессный режим
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+# Сколько секунд ждать завершения текущих запросов после SIGTERM
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "30"))
+# Пауза между перезапусками упавших воркеров
+RESTART_DELAY = 1.0
 
 
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_schema)
 
 
-async def start():
-    await init_db()
+async def prepare_db():
+    """Схема создаётся один раз в родителе отдельным движком.
+
+    Пулы приложения до fork не открываются: соединения aiosqlite живут
+    в потоках, которые в дочерний процесс не переходят.
+    """
+    schema_engine = create_async_engine(engine.url)
+    try:
+        async with schema_engine.begin() as conn:
+            await conn.run_sync(create_schema)
+    finally:
+        await schema_engine.dispose()
+
+
+async def serve(host: str, port: int, reuse_port: bool = False, invalidations=None):
+    """Запуск сервера до SIGTERM/SIGINT с мягким завершением"""
     app = await init_app()
-    runner = web.AppRunner(app)
+    if invalidations is not None:
+        share_invalidations(app, invalidations)
+    runner = web.AppRunner(app, shutdown_timeout=SHUTDOWN_TIMEOUT)
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', 8080)
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port)
     await site.start()
-    print("Server started at http://0.0.0.0:8080")
-    while True:
-        await asyncio.sleep(3600)
-
 
-if __name__ == '__main__':
-    loop = asyncio.get_event_loop()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    print(f"Server started at http://{host}:{port} (pid {os.getpid()})")
     try:
-        loop.run_until_complete(start())
-    except KeyboardInterrupt:
-        pass
+        await stop.wait()
+        if not await drain(runner, SHUTDOWN_TIMEOUT):
+            print(f"Shutdown timeout, cancelling {runner.app['inflight'].count} requests")
     finally:
-        loop.close()
+        await runner.cleanup()
+
+
+async def start(host: str = HOST, port: int = PORT):
+    await init_db()
+    await serve(host, port)
+
+
+def run_worker(host: str, port: int, invalidations):
+    # Обработчики сигналов супервизора наследуются при fork
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    asyncio.run(serve(host, port, reuse_port=True, invalidations=invalidations))
+
+
+def supervise(workers: int, host: str, port: int):
+    """Pre-fork: воркеры делят порт через SO_REUSEPORT, упавшие перезапускаются"""
+    asyncio.run(prepare_db())
+
+    context = multiprocessing.get_context("fork")
+    invalidations = context.Value("Q", 0)
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    def spawn():
+        process = context.Process(target=run_worker, args=(host, port, invalidations))
+        process.start()
+        return process
+
+    processes = [spawn() for _ in range(workers)]
+    while not stopping:
+        time.sleep(RESTART_DELAY)
+        for index, process in enumerate(processes):
+            if not stopping and not process.is_alive():
+                print(f"Worker {process.pid} exited with code {process.exitcode}, restarting")
+                processes[index] = spawn()
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT + 5
+    for process in processes:
+        process.join(max(0, deadline - time.monotonic()))
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        supervise(args.workers, args.host, args.port)
+    else:
+        try:
+            asyncio.run(start(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+import asyncio
+from app.models import create_search_index, rebuild_search_index
+from app.database import engine
+
+
+async def rebuild():
+    async with engine.begin() as conn:
+        await conn.run_sync(create_search_index)
+        await conn.run_sync(rebuild_search_index)
+    print("Поисковый индекс перестроен успешно!")
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild())